@@ -0,0 +1,160 @@
+import re
+import hashlib
+from collections import defaultdict
+
+# ======================================================================
+#  DEDUPLICA DI QUASI-DUPLICATI
+#  - MinHash + LSH sui chunk in ingestione, all'interno di ciascun indice
+#    (lo stesso annuncio ripetuto, righe e blocchi ricorrenti)
+#  - MinHash sui documenti ricomposti in fase di ricerca
+# ======================================================================
+
+NUM_PERM = 64
+BANDS = 16                 # 16 bande × 4 righe: coppie con Jaccard ≳ 0.5 diventano candidate
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 5
+THRESHOLD = 0.85           # Jaccard stimata minima per considerare due chunk duplicati
+
+_PRIME = (1 << 61) - 1
+
+
+def _hash64(s: str) -> int:
+    # hash stabile tra processi (hash() di Python è randomizzato)
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+# Permutazioni (a, b) deterministiche, uguali in tutti i worker
+_PERMS = [
+    (_hash64(f"a{i}") % (_PRIME - 1) + 1, _hash64(f"b{i}") % _PRIME)
+    for i in range(NUM_PERM)
+]
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def tokens(text: str) -> list[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def shingles(text: str, k: int = SHINGLE_SIZE) -> set[int]:
+    words = tokens(text)
+    if len(words) <= k:
+        return {_hash64(" ".join(words))} if words else set()
+    return {_hash64(" ".join(words[i:i+k])) for i in range(len(words) - k + 1)}
+
+
+def minhash(text: str) -> tuple:
+    """Firma MinHash del testo (tupla di NUM_PERM interi)."""
+    sh = shingles(text)
+    if not sh:
+        return ()
+    return tuple(min((a * x + b) % _PRIME for x in sh) for a, b in _PERMS)
+
+
+def jaccard(sig1: tuple, sig2: tuple) -> float:
+    """Stima della similarità di Jaccard da due firme MinHash."""
+    if not sig1 or not sig2:
+        return 0.0
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / len(sig1)
+
+
+def cluster_signatures(signatures: list[tuple], threshold: float = THRESHOLD) -> list[list[int]]:
+    """
+    Raggruppa le firme quasi-duplicate con LSH a bande + union-find.
+    Restituisce i cluster con almeno due elementi (liste di posizioni).
+    """
+    parent = list(range(len(signatures)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for band in range(BANDS):
+        buckets = defaultdict(list)
+        for i, sig in enumerate(signatures):
+            if sig:
+                buckets[sig[band*ROWS:(band+1)*ROWS]].append(i)
+        for members in buckets.values():
+            first = members[0]
+            for other in members[1:]:
+                ri, rj = find(first), find(other)
+                if ri != rj and jaccard(signatures[first], signatures[other]) >= threshold:
+                    parent[rj] = ri
+
+    clusters = defaultdict(list)
+    for i in range(len(signatures)):
+        clusters[find(i)].append(i)
+    return [c for c in clusters.values() if len(c) > 1]
+
+
+def dedup_records(records_by_source: dict, threshold: float = THRESHOLD) -> dict:
+    """
+    Elimina i chunk quasi-duplicati all'interno di ciascuna sorgente (un
+    indice per sorgente): per ogni cluster resta il primo record, che viene
+    indicizzato una volta e riporta gli id degli altri in metadata["aliases"].
+    Tra indici diversi non si elimina nulla: ogni indice resta completo.
+    L'ultimo chunk rimasto di un documento non viene mai eliminato (un
+    evento è un solo vettore); gli altri chunk del documento ricordano dove
+    trovare il testo dei chunk eliminati, per ricomporlo per intero:
+    metadata["duplicates"] = ["<chunk_index>=<id del chunk tenuto>", ...].
+    I record devono avere la firma in record["signature"].
+    """
+    result = {}
+    for name, records in records_by_source.items():
+        remaining = defaultdict(int)
+        for r in records:
+            if r["metadata"].get("kind") != "doc":
+                remaining[r["metadata"]["unid"]] += 1
+
+        dropped, duplicates = set(), defaultdict(list)
+        for cluster in cluster_signatures([r["signature"] for r in records], threshold):
+            keep = records[cluster[0]]
+            aliases = []
+            for i in cluster[1:]:
+                r = records[i]
+                unid = r["metadata"]["unid"]
+                if remaining[unid] <= 1:
+                    continue
+                remaining[unid] -= 1
+                dropped.add(i)
+                aliases.append(r["id"])
+                duplicates[unid].append(f"{r['metadata'].get('chunk_index') or 0}={keep['id']}")
+            if aliases:
+                keep["metadata"]["aliases"] = aliases
+
+        kept = []
+        for i, r in enumerate(records):
+            r.pop("signature", None)
+            if i in dropped:
+                continue
+            if r["metadata"]["unid"] in duplicates and r["metadata"].get("kind") != "doc":
+                r["metadata"]["duplicates"] = duplicates[r["metadata"]["unid"]]
+            kept.append(r)
+        result[name] = kept
+    return result
+
+
+# ======================================================================
+#  DEDUPLICA DEI RISULTATI
+# ======================================================================
+
+def dedup_docs(docs: list[dict], threshold: float = 0.7) -> list[dict]:
+    """
+    Rimuove dai risultati i documenti quasi-identici a uno già presente
+    (es. lo stesso annuncio come post, notizia ed evento). I documenti
+    devono essere in ordine di rilevanza: resta il primo, che eredita
+    l'unid degli altri in doc["aliases"].
+    """
+    kept = []
+    for doc in docs:
+        signature = minhash(doc["content"])
+        duplicate_of = next(
+            (k for k, sig in kept if jaccard(sig, signature) >= threshold), None
+        )
+        if duplicate_of is None:
+            kept.append((doc, signature))
+        else:
+            duplicate_of.setdefault("aliases", []).append(doc["unid"])
+    return [doc for doc, _ in kept]
@@ -0,0 +1,233 @@
+import os
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# ======================================================================
+#  DOCUMENT STORE LOCALE
+#  In modalità metadata compatta i vettori Pinecone portano solo i campi
+#  filtrabili; testo dei chunk e campi del documento (titolo, url, ...)
+#  stanno qui, una volta sola per documento, su SQLite.
+#  Uno store per versione dell'indice (DOCSTORE_DIR/<indice>.sqlite): una
+#  ricostruzione (--rebuild) scrive il suo senza toccare quello servito
+#  dalla versione corrente.
+#    documents(unid, source, file, fields JSON)   file: export di provenienza
+#    chunks(unid, chunk_index, text)
+# ======================================================================
+
+DOCSTORE_DIR = os.environ.get("CONFVA_DOCSTORE", "docstore")
+
+# Campi che restano nei metadata del vettore: servono ai filtri o a
+# ricomporre i documenti senza leggere lo store
+COMPACT_FIELDS = {"unid", "source", "date", "data", "chunk_index", "chunk_total", "aliases", "duplicates", "kind"}
+
+
+class LRUCache:
+    def __init__(self, capacity: int = 4096):
+        self.capacity = capacity
+        self._data = OrderedDict()
+
+    def get(self, key, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.capacity:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+
+class DocStore:
+    def __init__(self, path: str, cache_size: int = 4096):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                unid TEXT PRIMARY KEY,
+                source TEXT,
+                file TEXT,
+                fields TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                unid TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (unid, chunk_index)
+            );
+        """)
+        # store creati prima della colonna file
+        if "file" not in [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN file TEXT")
+        self._chunks = LRUCache(cache_size)
+        self._documents = LRUCache(cache_size)
+
+    # ------------------------------------------------------------------
+    # Scrittura (ingestione)
+    # ------------------------------------------------------------------
+
+    def put(self, documents: dict, chunks: list[tuple]):
+        """
+        documents: {unid: (source, file, fields)}
+        chunks: [(unid, chunk_index, text)]
+        """
+        with self._lock, self._conn:
+            # un documento accorciato non deve tenere i chunk in più della versione precedente
+            self._conn.executemany("DELETE FROM chunks WHERE unid = ?", [(unid,) for unid in documents])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO documents (unid, source, file, fields) VALUES (?, ?, ?, ?)",
+                [(unid, source, file, json.dumps(fields, ensure_ascii=False))
+                 for unid, (source, file, fields) in documents.items()]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (unid, chunk_index, text) VALUES (?, ?, ?)",
+                chunks
+            )
+            self._chunks.clear()
+            self._documents.clear()
+
+    def prune(self, keep, files) -> int:
+        """
+        Elimina i documenti (e i loro chunk) degli export in files che non
+        sono più in keep; quelli degli altri export restano. Restituisce quanti.
+        """
+        keep, files = set(keep), set(files)
+        with self._lock, self._conn:
+            stale = [(unid,) for unid, file in self._conn.execute("SELECT unid, file FROM documents")
+                     if file in files and unid not in keep]
+            self._conn.executemany("DELETE FROM documents WHERE unid = ?", stale)
+            self._conn.executemany("DELETE FROM chunks WHERE unid = ?", stale)
+            self._chunks.clear()
+            self._documents.clear()
+        return len(stale)
+
+    # ------------------------------------------------------------------
+    # Lettura (query), con cache LRU
+    # ------------------------------------------------------------------
+
+    def get_documents(self, unids) -> dict:
+        result, missing = {}, []
+        for unid in set(unids):
+            fields = self._documents.get(unid)
+            if fields is None:
+                missing.append(unid)
+            else:
+                result[unid] = fields
+        if missing:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT unid, fields FROM documents WHERE unid IN ({','.join('?' * len(missing))})",
+                    missing
+                ).fetchall()
+            for unid, fields in rows:
+                result[unid] = json.loads(fields)
+                self._documents.put(unid, result[unid])
+        return result
+
+    def get_chunks(self, keys) -> dict:
+        """keys: [(unid, chunk_index)] → {(unid, chunk_index): text}"""
+        result, missing = {}, []
+        for key in set(keys):
+            text = self._chunks.get(key)
+            if text is None:
+                missing.append(key)
+            else:
+                result[key] = text
+        # in blocchi per restare sotto il limite di parametri di SQLite
+        for i in range(0, len(missing), 400):
+            block = missing[i:i+400]
+            where = " OR ".join(["(unid = ? AND chunk_index = ?)"] * len(block))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT unid, chunk_index, text FROM chunks WHERE {where}",
+                    [v for key in block for v in key]
+                ).fetchall()
+            for unid, chunk_index, text in rows:
+                result[(unid, chunk_index)] = text
+                self._chunks.put((unid, chunk_index), text)
+        return result
+
+    def document_text(self, unid: str):
+        """Testo completo del documento, chunk in ordine; None se non è nello store."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT text FROM chunks WHERE unid = ? ORDER BY chunk_index", (unid,)
+            ).fetchall()
+        return "\n".join(text for (text,) in rows) if rows else None
+
+    def iter_chunks(self, page_size: int = 1000):
+        """Tutti i chunk con la sorgente del documento: (unid, chunk_index, source, text)."""
+        offset = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT c.unid, c.chunk_index, d.source, c.text FROM chunks c "
+                    "LEFT JOIN documents d ON d.unid = c.unid "
+                    "ORDER BY c.rowid LIMIT ? OFFSET ?",
+                    (page_size, offset)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            offset += len(rows)
+
+    def hydrate(self, metadatas: list[dict]):
+        """Completa in place i metadata compatti con testo e campi del documento."""
+        compact = [m for m in metadatas if "text" not in m and m.get("unid")]
+        if not compact:
+            return
+        documents = self.get_documents(m["unid"] for m in compact)
+        chunks = self.get_chunks((m["unid"], int(m.get("chunk_index") or 0)) for m in compact)
+        for m in compact:
+            for key, value in documents.get(m["unid"], {}).items():
+                m.setdefault(key, value)
+            m["text"] = chunks.get((m["unid"], int(m.get("chunk_index") or 0)), "")
+
+    def close(self):
+        self._conn.close()
+
+
+def docstore_path(index_name: str, path: str = DOCSTORE_DIR) -> str:
+    return os.path.join(path, f"{index_name}.sqlite")
+
+
+def open_store(index_name: str, path: str = DOCSTORE_DIR):
+    """Store della versione dell'indice, oppure None se non ha avuto un'ingestione compatta."""
+    store_path = docstore_path(index_name, path)
+    return DocStore(store_path) if os.path.exists(store_path) else None
+
+
+def compact_records(records: list[dict], store: DocStore):
+    """
+    Sposta nello store testo e campi di documento dei record, lasciando nei
+    metadata del vettore solo COMPACT_FIELDS. I documenti scomparsi dagli
+    export di questi record escono dallo store; quelli degli altri export
+    (ingestione di un solo file) restano.
+    """
+    documents, chunks = {}, []
+    for record in records:
+        metadata = record["metadata"]
+        unid = metadata["unid"]
+        text = metadata.get("text", record["text"])
+        if metadata.get("kind") == "doc":
+            # il vettore di documento serve solo a trovare l'unid: nello store non aggiunge nulla
+            record["metadata"] = {k: v for k, v in metadata.items() if k in COMPACT_FIELDS}
+            continue
+        chunks.append((unid, int(metadata.get("chunk_index") or 0), text))
+        documents[unid] = (
+            metadata.get("source"),
+            record.get("file"),
+            {k: v for k, v in metadata.items() if k not in COMPACT_FIELDS and k != "text"}
+        )
+        record["metadata"] = {k: v for k, v in metadata.items() if k in COMPACT_FIELDS}
+    store.put(documents, chunks)
+    store.prune(documents, {record.get("file") for record in records})
@@ -0,0 +1,197 @@
+import os
+import json
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================================================================
+#  EMBEDDER
+#  Chi calcola gli embedding è intercambiabile:
+#    openai[:modello]   API OpenAI (default text-embedding-3-small, 1536)
+#    local[:modello]    modello sentence-transformers su CPU, in locale:
+#                       nessuna chiamata di rete né quota API
+#  Ogni indice ricorda con quale embedder è stato costruito (e quindi la
+#  dimensione): query e ingestioni successive usano lo stesso.
+#
+#  Esempi:
+#    CONFVA_EMBEDDER=local python ingest.py news --rebuild
+#    python ingest.py news --rebuild --embedder local:intfloat/multilingual-e5-small
+# ======================================================================
+
+EMBED_MODEL = "text-embedding-3-small"
+EMBED_DIM = 1536          # dimensione dei vettori di text-embedding-3-small
+
+# Dimensione dei modelli OpenAI noti; per gli altri si ricava da un embedding di prova
+OPENAI_DIMS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+# Modello locale di default: multilingue (italiano compreso), 384 dimensioni
+LOCAL_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+DEFAULT_EMBEDDER = os.environ.get("CONFVA_EMBEDDER", "openai")
+
+# Una scheda JSON per indice: {"embedder": "local:...", "dimension": 384}
+EMBEDDERS_DIR = os.environ.get("CONFVA_INDEX_EMBEDDERS", "index_embedders")
+
+
+class Embedder(ABC):
+    spec = ""
+    remote = False            # True: chiamate di rete soggette a rate limit
+
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        ...
+
+    @abstractmethod
+    def embed(self, texts: list[str]) -> list[list[float]]:
+        ...
+
+    async def embed_async(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed, texts)
+
+
+class OpenAIEmbedder(Embedder):
+    remote = True
+
+    def __init__(self, model: str = EMBED_MODEL, dimension: int = None):
+        self.model = model
+        self.spec = f"openai:{model}"
+        self._dimension = dimension or OPENAI_DIMS.get(model)
+        self._client = None
+        self._aclient = None
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = len(self.embed(["dimensione"])[0])
+        return self._dimension
+
+    def embed(self, texts):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        response = self._client.embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+    async def embed_async(self, texts):
+        if self._aclient is None:
+            from openai import AsyncOpenAI
+            self._aclient = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        response = await self._aclient.embeddings.create(model=self.model, input=texts)
+        return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+
+
+# Modelli locali già caricati in questo processo
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _load_model(model_name: str):
+    with _models_lock:
+        if model_name not in _models:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise ImportError("L'embedder locale richiede sentence-transformers: "
+                                  "pip install sentence-transformers")
+            print(f"🧠 Caricamento modello locale {model_name}")
+            _models[model_name] = SentenceTransformer(model_name, device="cpu")
+        return _models[model_name]
+
+
+class LocalEmbedder(Embedder):
+    """
+    Modello sentence-transformers su CPU, caricato una sola volta per
+    processo. I testi vengono codificati a batch, più batch in parallelo
+    su un pool di thread (l'inferenza rilascia il GIL).
+    """
+
+    def __init__(self, model_name: str = LOCAL_MODEL, batch_size: int = 32, threads: int = 2):
+        self.model_name = model_name
+        self.spec = f"local:{model_name}"
+        self.batch_size = batch_size
+        self.threads = threads
+        self._pool = None
+
+    @property
+    def model(self):
+        return _load_model(self.model_name)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True,
+                                 normalize_embeddings=True, show_progress_bar=False).tolist()
+
+    def embed(self, texts):
+        if len(texts) <= self.batch_size:
+            return self._encode(texts)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="embed")
+        batches = [texts[i:i+self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        return [v for vectors in self._pool.map(self._encode, batches) for v in vectors]
+
+
+_embedders = {}
+
+
+def get_embedder(spec: str = None) -> Embedder:
+    """Embedder per 'openai[:modello]' o 'local[:modello]', uno per processo."""
+    spec = spec or DEFAULT_EMBEDDER
+    if spec not in _embedders:
+        kind, _, model = spec.partition(":")
+        if kind == "openai":
+            _embedders[spec] = OpenAIEmbedder(model or EMBED_MODEL)
+        elif kind == "local":
+            _embedders[spec] = LocalEmbedder(model or LOCAL_MODEL)
+        else:
+            raise ValueError(f"Embedder sconosciuto '{spec}' (openai[:modello], local[:modello])")
+    return _embedders[spec]
+
+
+# ======================================================================
+#  EMBEDDER PER INDICE
+# ======================================================================
+
+def _info_path(index_name: str, path: str = EMBEDDERS_DIR) -> str:
+    return os.path.join(path, f"{index_name}.json")
+
+
+def index_info(index_name: str, path: str = EMBEDDERS_DIR) -> dict:
+    """Embedder e dimensione dell'indice; gli indici senza scheda sono quelli storici OpenAI."""
+    info_path = _info_path(index_name, path)
+    if not os.path.exists(info_path):
+        return {"embedder": f"openai:{EMBED_MODEL}", "dimension": EMBED_DIM}
+    with open(info_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def register_index(index_name: str, spec: str, dimension: int, path: str = EMBEDDERS_DIR):
+    """Salva la scheda dell'indice (un file per indice: processi paralleli non si pestano)."""
+    os.makedirs(path, exist_ok=True)
+    info_path = _info_path(index_name, path)
+    tmp = info_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"embedder": spec, "dimension": dimension}, f)
+    os.replace(tmp, info_path)
+
+
+def manifest_embedder(manifest: dict) -> str:
+    """Embedder di uno snapshot; i manifest più vecchi riportano solo il modello OpenAI."""
+    spec = manifest.get("embed_model") or EMBED_MODEL
+    return spec if spec.split(":")[0] in ("openai", "local") else f"openai:{spec}"
+
+
+def index_dimension(index_name: str, path: str = EMBEDDERS_DIR) -> int:
+    return index_info(index_name, path)["dimension"]
+
+
+def index_embedder(index_name: str, path: str = EMBEDDERS_DIR) -> Embedder:
+    return get_embedder(index_info(index_name, path)["embedder"])
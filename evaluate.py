@@ -0,0 +1,220 @@
+import os
+import json
+import argparse
+from datetime import date
+
+# ======================================================================
+#  VALUTAZIONE DEL RECUPERO
+#  Un insieme di domande di riferimento (golden set) con gli unid attesi,
+#  eseguito sugli snapshot locali degli indici (vedi snapshot.py): stessi
+#  dati a ogni esecuzione, nessuna chiamata a Pinecone. Tutto il corpus
+#  viene dallo snapshot: testo dei chunk, BM25 (costruito prima della prima
+#  domanda), indice delle date degli eventi e sintesi; le date relative
+#  ("prossimi eventi") si calcolano rispetto a un giorno fisso. Per ciascuna
+#  configurazione riporta recall@k, MRR, token del contesto e latenza per
+#  fase; con due configurazioni le mette a confronto.
+#
+#  Golden set, una domanda per riga (JSONL); "today" (facoltativo) fissa il
+#  giorno della domanda:
+#    {"query": "prossimi webinar sulla sicurezza", "expected": ["ABC123", "DEF456"], "today": "2026-03-01"}
+#
+#  Configurazione: coppie chiave=valore separate da virgole
+#    snapshot=DIR         cartella con uno snapshot per sorgente (DIR/events, DIR/posts, DIR/news)
+#                         ed eventualmente DIR/summaries.sqlite (ingest.py --summaries DIR/summaries.sqlite)
+#    today=AAAA-MM-GG     giorno di riferimento delle domande (default: data dello snapshot)
+#    chunks_per_doc=N     chunk per documento nel passaggio per documenti
+#    lexical=false        senza candidati BM25
+#    summaries=false      contesto a testo pieno anche con le sintesi disponibili
+#    altre chiavi         parametri di search_and_recompose_async (top_k, doc_first, siblings, ...)
+#
+#  Esempi:
+#    python evaluate.py golden.jsonl --a snapshot=snapshots/v1,top_k=3
+#    python evaluate.py golden.jsonl --a snapshot=snapshots/v1,top_k=3 --b snapshot=snapshots/v1,top_k=5 --k 5
+# ======================================================================
+
+# etichetta dell'indice in promptConfVa → cartella dello snapshot (nome della sorgente)
+SNAPSHOT_DIRS = {"posts": "posts", "news": "news", "eventi": "events"}
+
+STAGES = ("embed", "retrieve", "recompose", "total")
+
+
+def parse_config(text: str) -> dict:
+    config = {}
+    for pair in filter(None, text.split(",")):
+        key, _, value = pair.partition("=")
+        try:
+            config[key.strip()] = json.loads(value)
+        except ValueError:
+            config[key.strip()] = value.strip()
+    if "snapshot" not in config:
+        raise SystemExit(f"Configurazione senza snapshot: {text}")
+    return config
+
+
+def load_golden(path: str) -> list[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def doc_unids(doc: dict) -> set:
+    """Unid coperti da un documento: il suo e quelli dei quasi-duplicati accorpati."""
+    return {doc["unid"], *doc.get("aliases", [])}
+
+
+def score_query(docs: list, expected: list, k: int) -> dict:
+    expected = set(expected)
+    found, first = set(), None
+    for rank, doc in enumerate(docs, start=1):
+        hits = doc_unids(doc) & expected
+        if hits and first is None:
+            first = rank
+        if rank <= k:
+            found |= hits
+    return {
+        "recall": len(found) / len(expected) if expected else 0.0,
+        "rr": 1 / first if first else 0.0,
+    }
+
+
+def snapshot_store(index):
+    """Document store in memoria con i chunk di uno snapshot: idratazione e BM25 sui suoi dati."""
+    from doc_store import DocStore, compact_records
+
+    store = DocStore(":memory:")
+    compact_records([{"id": vector_id, "text": metadata.get("text") or "", "metadata": dict(metadata)}
+                     for vector_id, metadata in zip(index.ids, index.metadata)], store)
+    return store
+
+
+def as_date(value) -> date:
+    return value if isinstance(value, date) else date.fromisoformat(str(value)[:10])
+
+
+def run_config(config: dict, golden: list[dict], k: int) -> dict:
+    import promptConfVa as rag
+    from snapshot import LocalIndex
+    from embedders import get_embedder, manifest_embedder
+    from ingest_core import estimate_tokens
+    from lexical import CandidateCache
+    from event_dates import DateIndex
+    from summaries import open_summaries
+
+    indexes, embedders = {}, {}
+    for label, name in SNAPSHOT_DIRS.items():
+        path = os.path.join(config["snapshot"], name)
+        if os.path.exists(path):
+            indexes[label] = LocalIndex(path)
+            embedders[label] = get_embedder(manifest_embedder(indexes[label].manifest))
+    if not indexes:
+        raise SystemExit(f"Nessuno snapshot in {config['snapshot']}")
+
+    # Corpus congelato: niente document store, indice delle date o sintesi correnti
+    events = indexes.get("eventi")
+    rag.pin_corpus(
+        {label: snapshot_store(index) for label, index in indexes.items()},
+        date_index=DateIndex.from_records([{"metadata": m} for m in events.metadata]) if events else None,
+        summaries=open_summaries(os.path.join(config["snapshot"], "summaries.sqlite")),
+    )
+    created = [index.manifest["created"] for index in indexes.values() if "created" in index.manifest]
+    if not config.get("today") and not created:
+        raise SystemExit(f"Snapshot senza data in {config['snapshot']}: indicare today=AAAA-MM-GG")
+    today = as_date(config.get("today") or max(created))
+
+    search_options = {key: value for key, value in config.items()
+                      if key not in ("snapshot", "chunks_per_doc", "lexical", "summaries", "today")}
+    saved = rag.CHUNKS_PER_DOC, rag.candidate_cache
+    rag.CHUNKS_PER_DOC = config.get("chunks_per_doc", rag.CHUNKS_PER_DOC)
+    if config.get("lexical", True) is False:
+        rag.lexical_index = None
+
+    results = []
+    try:
+        for item in golden:
+            # nessun riuso tra domande o configurazioni: ogni domanda fa il recupero completo
+            rag.candidate_cache = CandidateCache()
+            timings = {}
+            docs = rag.run_sync(rag.search_and_recompose_async(
+                item["query"], indexes=indexes, embedders=embedders, timings=timings,
+                today=as_date(item["today"]) if item.get("today") else today, **search_options
+            ))
+            timings["total"] = sum(timings.values())
+            results.append({
+                "query": item["query"],
+                "retrieved": [doc["unid"] for doc in docs],
+                "docs": len(docs),
+                "tokens": estimate_tokens(rag.build_prompt(
+                    item["query"], rag.context_docs(docs) if config.get("summaries", True) else docs
+                )),
+                "timings": timings,
+                **score_query(docs, item["expected"], k),
+            })
+    finally:
+        rag.CHUNKS_PER_DOC, rag.candidate_cache = saved
+    return {"config": config, "queries": results}
+
+
+def summarize(run: dict, k: int) -> dict:
+    queries = run["queries"]
+    n = len(queries) or 1
+    summary = {
+        f"recall@{k}": sum(q["recall"] for q in queries) / n,
+        "MRR": sum(q["rr"] for q in queries) / n,
+        "documenti": sum(q["docs"] for q in queries) / n,
+        "token contesto": sum(q["tokens"] for q in queries) / n,
+    }
+    for stage in STAGES:
+        values = [q["timings"].get(stage, 0.0) * 1000 for q in queries]
+        summary[f"{stage} ms p50"] = percentile(values, 50)
+        summary[f"{stage} ms p95"] = percentile(values, 95)
+    return summary
+
+
+def print_report(summaries: list[dict], labels: list[str]):
+    width = max(len(key) for key in summaries[0]) + 2
+    print("".ljust(width) + "".join(label.rjust(12) for label in labels)
+          + ("Δ".rjust(12) if len(summaries) == 2 else ""))
+    for key in summaries[0]:
+        values = [s[key] for s in summaries]
+        row = key.ljust(width) + "".join(f"{v:12.3f}" for v in values)
+        if len(values) == 2:
+            row += f"{values[1] - values[0]:+12.3f}"
+        print(row)
+
+
+# ======================================================================
+#  MAIN
+# ======================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valutazione del recupero su un golden set e snapshot locali")
+    parser.add_argument("golden", help="golden set JSONL: {\"query\", \"expected\": [unid, ...]}")
+    parser.add_argument("--a", required=True, help="configurazione A (es. snapshot=snapshots/v1,top_k=3)")
+    parser.add_argument("--b", help="configurazione B, da confrontare con A")
+    parser.add_argument("--k", type=int, default=5, help="documenti considerati per recall@k (default 5)")
+    parser.add_argument("--output", help="salva i risultati per domanda in JSON")
+    args = parser.parse_args(argv)
+
+    golden = load_golden(args.golden)
+    configs = [parse_config(args.a)] + ([parse_config(args.b)] if args.b else [])
+    runs = [run_config(config, golden, args.k) for config in configs]
+
+    print(f"📊 {len(golden)} domande")
+    for label, config in zip("AB", configs):
+        print(f"   {label}: {config}")
+    print()
+    print_report([summarize(run, args.k) for run in runs], list("AB"[:len(runs)]))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(runs, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
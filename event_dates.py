@@ -0,0 +1,157 @@
+import os
+import re
+import json
+import calendar
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+
+from sources import parse_date
+
+# ======================================================================
+#  INDICE DELLE DATE DEGLI EVENTI
+#  Costruito dall'ingestione degli eventi: date (AAAAMMGG) ordinate con
+#  l'unid corrispondente. Le domande come "prossimi eventi" o "eventi a
+#  marzo" diventano una ricerca per intervallo (bisect), esatta, invece di
+#  sperare che la ricerca vettoriale porti gli eventi giusti nel top-k.
+#
+#  Un file per versione dell'indice eventi (EVENT_DATES_DIR/<indice>.json),
+#  come il document store: una ricostruzione scrive il suo e le query lo
+#  leggono solo dopo lo switch dell'alias.
+#
+#  {"dates": [20260305, 20260312, ...], "unids": ["ABC...", "DEF...", ...]}
+# ======================================================================
+
+EVENT_DATES_DIR = os.environ.get("CONFVA_EVENT_DATES", "event_dates")
+
+MONTHS = ["gennaio", "febbraio", "marzo", "aprile", "maggio", "giugno", "luglio",
+          "agosto", "settembre", "ottobre", "novembre", "dicembre"]
+
+_EVENT_RE = re.compile(r"\b(event[oi]|incontr[oi]|convegn[oi]|webinar|seminar[io]|cors[oi]|"
+                       r"workshop|appuntament[oi]|calendario|in programma)\b", re.IGNORECASE)
+_MONTH_RE = re.compile(r"\b(" + "|".join(MONTHS) + r")\b(?:\s+(\d{4}))?", re.IGNORECASE)
+_UPCOMING_RE = re.compile(r"\b(prossim[oiae]|futur[oiae]|in programma|imminent[ei])\b", re.IGNORECASE)
+
+
+def _as_int(d: date) -> int:
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+class DateIndex:
+    def __init__(self, dates: list[int] = None, unids: list[str] = None):
+        self.dates = dates or []
+        self.unids = unids or []
+
+    @classmethod
+    def from_records(cls, records: list[dict]) -> "DateIndex":
+        """Dai record degli eventi (metadata "data" = AAAA-MM-GG); i vettori di documento sono saltati."""
+        pairs = set()
+        for record in records:
+            metadata = record["metadata"]
+            if metadata.get("kind") == "doc" or not metadata.get("data"):
+                continue
+            pairs.add((parse_date(metadata["data"]), metadata["unid"]))
+        pairs = sorted(pairs)
+        return cls([d for d, _ in pairs], [u for _, u in pairs])
+
+    def range(self, start: int, end: int = None, limit: int = None) -> list[tuple]:
+        """[(data, unid)] con start <= data <= end (end None: senza limite), in ordine di data."""
+        lo = bisect_left(self.dates, start)
+        hi = bisect_right(self.dates, end) if end is not None else len(self.dates)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return list(zip(self.dates[lo:hi], self.unids[lo:hi]))
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dates": self.dates, "unids": self.unids}, f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> "DateIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["dates"], data["unids"])
+
+
+def event_dates_path(index_name: str, path: str = EVENT_DATES_DIR) -> str:
+    return os.path.join(path, f"{index_name}.json")
+
+
+def build_date_index(records: list[dict], index_name: str, path: str = EVENT_DATES_DIR) -> DateIndex:
+    index = DateIndex.from_records(records)
+    index.save(event_dates_path(index_name, path))
+    print(f"📅 Indice date di {index_name}: {len(index.dates)} eventi")
+    return index
+
+
+_cache = {"path": None, "mtime": None, "index": None}
+
+
+def load_date_index(index_name: str, path: str = EVENT_DATES_DIR):
+    """
+    Indice della versione index_name, riletto solo se cambiano versione o
+    file; None se non è mai stato costruito.
+    """
+    file = event_dates_path(index_name, path)
+    if not os.path.exists(file):
+        return None
+    mtime = os.path.getmtime(file)
+    if (file, mtime) != (_cache["path"], _cache["mtime"]):
+        _cache["index"] = DateIndex.load(file)
+        _cache["path"], _cache["mtime"] = file, mtime
+    return _cache["index"]
+
+
+# ======================================================================
+#  DOMANDE CON DATE
+# ======================================================================
+
+def is_event_query(query: str) -> bool:
+    return bool(_EVENT_RE.search(query))
+
+
+def parse_date_query(query: str, today: date = None):
+    """
+    Intervallo (inizio, fine) in AAAAMMGG indicato dalla domanda, fine None
+    per "da oggi in poi"; None se la domanda non parla di date.
+    """
+    today = today or date.today()
+    q = query.lower()
+
+    if re.search(r"\boggi\b", q):
+        return _as_int(today), _as_int(today)
+    if re.search(r"\bdomani\b", q):
+        tomorrow = today + timedelta(days=1)
+        return _as_int(tomorrow), _as_int(tomorrow)
+    if re.search(r"\b(prossima settimana|settimana prossima)\b", q):
+        monday = today + timedelta(days=7 - today.weekday())
+        return _as_int(monday), _as_int(monday + timedelta(days=6))
+    if re.search(r"\bquesta settimana\b", q):
+        return _as_int(today), _as_int(today + timedelta(days=6 - today.weekday()))
+    if re.search(r"\b(prossimo mese|mese prossimo)\b", q):
+        year, month = (today.year + 1, 1) if today.month == 12 else (today.year, today.month + 1)
+        return _as_int(date(year, month, 1)), _as_int(date(year, month, calendar.monthrange(year, month)[1]))
+    if re.search(r"\bquesto mese\b", q):
+        return _as_int(today), _as_int(date(today.year, today.month, calendar.monthrange(today.year, today.month)[1]))
+
+    m = _MONTH_RE.search(q)
+    if m:
+        month = MONTHS.index(m.group(1)) + 1
+        # senza anno: il prossimo mese con quel nome (quello corrente compreso)
+        year = int(m.group(2)) if m.group(2) else today.year + (month < today.month)
+        return _as_int(date(year, month, 1)), _as_int(date(year, month, calendar.monthrange(year, month)[1]))
+
+    if _UPCOMING_RE.search(q):
+        return _as_int(today), None
+    return None
+
+
+def in_range(value: str, date_range: tuple) -> bool:
+    """value AAAA-MM-GG dentro l'intervallo (inizio, fine)?"""
+    if not value:
+        return False
+    start, end = date_range
+    d = parse_date(value)
+    return d >= start and (end is None or d <= end)
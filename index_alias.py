@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import argparse
+
+# ======================================================================
+#  ALIAS DEGLI INDICI (blue/green)
+#  Pinecone non ha alias nativi: il puntatore alias → versione vive in un
+#  file JSON locale, riscritto in modo atomico. Una ricostruzione completa
+#  scrive su un indice nuovo (es. confindustria-news-v7) mentre le query
+#  continuano sulla versione corrente; a fine ingestione si sposta
+#  l'alias e le versioni vecchie vengono eliminate.
+#
+#  {
+#    "confindustria-news": {
+#      "current": "confindustria-news-v7",
+#      "versions": ["confindustria-news-v6", "confindustria-news-v7"]
+#    }
+#  }
+# ======================================================================
+
+ALIASES_FILE = os.environ.get("CONFVA_INDEX_ALIASES", "index_aliases.json")
+
+
+def load_aliases(path: str = ALIASES_FILE) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_aliases(aliases: dict, path: str = ALIASES_FILE):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(aliases, f, indent=2)
+    os.replace(tmp, path)
+
+
+def resolve(alias: str, path: str = ALIASES_FILE) -> str:
+    """Nome dell'indice puntato dall'alias; senza alias è il nome stesso."""
+    return load_aliases(path).get(alias, {}).get("current", alias)
+
+
+def version_of(alias: str, index_name: str):
+    """Numero di versione di un indice dell'alias (0 = indice storico senza versione)."""
+    if index_name == alias:
+        return 0
+    m = re.fullmatch(re.escape(alias) + r"-v(\d+)", index_name)
+    return int(m.group(1)) if m else None
+
+
+def next_version(alias: str, existing: list[str], path: str = ALIASES_FILE) -> str:
+    """Primo nome di versione libero: alias-vN."""
+    known = set(existing) | set(load_aliases(path).get(alias, {}).get("versions", []))
+    versions = [v for v in (version_of(alias, name) for name in known) if v]
+    return f"{alias}-v{max(versions, default=0) + 1}"
+
+
+def switch(alias: str, target: str, path: str = ALIASES_FILE):
+    """Punta l'alias su target (operazione atomica sul file)."""
+    aliases = load_aliases(path)
+    entry = aliases.setdefault(alias, {"current": alias, "versions": []})
+    entry["current"] = target
+    if target not in entry["versions"]:
+        entry["versions"].append(target)
+    save_aliases(aliases, path)
+    print(f"🔀 {alias} → {target}")
+
+
+def version_files(index_name: str) -> list[str]:
+    """
+    File locali di una versione dell'indice: document store, scheda
+    dell'embedder, stato incrementale, indice delle date (solo eventi).
+    """
+    from doc_store import docstore_path
+    from embedders import EMBEDDERS_DIR
+    from event_dates import event_dates_path
+    from ingest_core import STATE_DIR
+
+    store = docstore_path(index_name)
+    return [store, store + "-wal", store + "-shm",
+            os.path.join(EMBEDDERS_DIR, f"{index_name}.json"),
+            os.path.join(STATE_DIR, f"{index_name}.json"),
+            event_dates_path(index_name)]
+
+
+def collect_garbage(pc, alias: str, keep: int = 2, path: str = ALIASES_FILE) -> list[str]:
+    """
+    Elimina le versioni più vecchie dell'alias, da Pinecone e i loro file
+    locali (version_files), tenendo la corrente e le keep-1 precedenti (per
+    un eventuale rollback).
+    """
+    aliases = load_aliases(path)
+    entry = aliases.get(alias)
+    if not entry:
+        return []
+
+    current = entry["current"]
+    existing = {idx["name"] for idx in pc.list_indexes()}
+    versions = sorted(
+        (name for name in existing | set(entry["versions"]) if version_of(alias, name) is not None),
+        key=lambda name: version_of(alias, name)
+    )
+    current_version = version_of(alias, current) or 0
+    older = [name for name in versions if version_of(alias, name) < current_version]
+    to_delete = older[:max(0, len(older) - (keep - 1))]
+
+    for name in to_delete:
+        if name in existing:
+            pc.delete_index(name)
+            print(f"🗑️ Eliminato {name}")
+        for file in version_files(name):
+            if os.path.exists(file):
+                os.remove(file)
+    entry["versions"] = [v for v in entry["versions"] if v not in to_delete]
+    save_aliases(aliases, path)
+    return to_delete
+
+
+class AliasResolver:
+    """
+    Risolve gli alias rileggendo il file solo quando cambia: i processi di
+    lunga durata (REPL) vedono lo switch senza riavvio.
+    """
+
+    def __init__(self, path: str = ALIASES_FILE):
+        self.path = path
+        self._mtime = None
+        self._aliases = {}
+
+    def changed(self) -> bool:
+        mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        self._aliases = load_aliases(self.path)
+        return True
+
+    def resolve(self, alias: str) -> str:
+        self.changed()
+        return self._aliases.get(alias, {}).get("current", alias)
+
+
+# ======================================================================
+#  MAIN
+# ======================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gestione degli alias degli indici Pinecone")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    sub.add_parser("show", help="mostra gli alias")
+
+    sw = sub.add_parser("switch", help="punta un alias su un indice (anche per rollback)")
+    sw.add_argument("alias")
+    sw.add_argument("target")
+
+    gc = sub.add_parser("gc", help="elimina le versioni vecchie di un alias")
+    gc.add_argument("alias")
+    gc.add_argument("--keep", type=int, default=2, help="versioni da conservare, corrente inclusa")
+
+    args = parser.parse_args(argv)
+    if args.command == "show":
+        print(json.dumps(load_aliases(), indent=2))
+    elif args.command == "switch":
+        switch(args.alias, args.target)
+    else:
+        from ingest_core import get_pinecone
+        collect_garbage(get_pinecone(), args.alias, keep=args.keep)
+
+
+if __name__ == "__main__":
+    main()
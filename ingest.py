@@ -0,0 +1,216 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from ingest_core import (RateLimiter, prepare_records, embed_and_upsert, content_hash,
+                         get_pinecone, wait_for_count)
+from index_alias import next_version, switch, collect_garbage, resolve
+from sources import SOURCES
+from dedup import minhash, dedup_records, THRESHOLD
+from doc_store import DocStore, compact_records, docstore_path, DOCSTORE_DIR
+from embedders import DEFAULT_EMBEDDER
+from event_dates import build_date_index
+from summaries import SummaryStore, summarize_records, SUMMARIES_PATH
+
+# ======================================================================
+#  INGESTIONE UNIFICATA: eventi, post, notiziario
+#
+#  Esempi:
+#    python ingest.py events posts news
+#    python ingest.py news:notiziario_2024.json news:notiziario_2025.json
+#    python ingest.py posts news --incremental --workers 2 --dry-run
+#    python ingest.py events posts news --rebuild --keep 2
+#    python ingest.py news --rebuild --embedder local
+#    python ingest.py news --summaries
+# ======================================================================
+
+
+# Rate limiter del processo worker, condiviso: tutte le sorgenti consumano lo stesso budget
+_limiter = None
+
+
+def _init_worker(limiter):
+    global _limiter
+    _limiter = limiter
+
+
+def _embed_and_upsert(name: str, records: list[dict], options: dict, index_name: str = None) -> dict:
+    return embed_and_upsert(SOURCES[name], records, limiter=_limiter, index_name=index_name, **options)
+
+
+def parse_exports(exports: list[str]) -> dict:
+    """Raggruppa gli argomenti 'sorgente[:file]' per sorgente."""
+    jobs = {}
+    for export in exports:
+        name, _, path = export.partition(":")
+        if name not in SOURCES:
+            raise SystemExit(f"Sorgente sconosciuta '{name}' (disponibili: {', '.join(SOURCES)})")
+        jobs.setdefault(name, []).append(path or SOURCES[name].default_path)
+    return jobs
+
+
+def rebuild_targets(jobs: dict) -> dict:
+    """Nuova versione dell'indice per ogni sorgente da ricostruire."""
+    existing = [idx["name"] for idx in get_pinecone().list_indexes()]
+    return {name: next_version(SOURCES[name].index_name, existing) for name in jobs}
+
+
+def promote(targets: dict, stats: list[dict], keep: int):
+    """Sposta gli alias sulle nuove versioni, quando sono interrogabili, e pulisce le vecchie."""
+    pc = get_pinecone()
+    for s in stats:
+        target = targets[s["source"]]
+        if not wait_for_count(pc.Index(target), s["embedded"]):
+            print(f"⚠️ {target}: conteggio vettori non ancora allineato, switch comunque")
+        switch(SOURCES[s["source"]].index_name, target)
+        collect_garbage(pc, SOURCES[s["source"]].index_name, keep=keep)
+
+
+def run(jobs: dict, workers: int, rpm: int, tpm: int, options: dict,
+        dedup_threshold: float = None, targets: dict = None, docstore: str = None,
+        doc_vectors: bool = True, summaries: str = None) -> list[dict]:
+    targets = targets or {}
+    limiter = RateLimiter(requests_per_minute=rpm, tokens_per_minute=tpm)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(limiter,)) as pool:
+        # 1️⃣ Preprocessing e chunking (CPU), elemento per elemento sul pool
+        records = {name: prepare_records(SOURCES[name], paths, pool=pool, doc_vectors=doc_vectors)
+                   for name, paths in jobs.items()}
+
+        # 📅 Eventi per l'indice delle date, presi prima della deduplica: ogni evento ha la sua data
+        events = list(records.get("events", []))
+
+        # 📝 Sintesi per unid, sul testo completo: prima di deduplica e metadata compatti
+        if summaries:
+            store = SummaryStore(summaries)
+            for name, recs in records.items():
+                stats = summarize_records(recs, store, dry_run=options.get("dry_run"))
+                print(f"📝 [{name}] {stats['generated']} sintesi generate, {stats['cached']} invariate, "
+                      f"{stats['deleted']} eliminate")
+            store.close()
+
+        # 📦 Metadata compatti: testo e campi di documento nel document store dell'indice di
+        # destinazione (con --rebuild la nuova versione: lo store corrente resta intatto).
+        # Prima della deduplica: lo store tiene il testo completo di ogni documento, lo stesso
+        # su cui sono calcolati gli hash delle sintesi
+        if docstore and not options.get("dry_run"):
+            for name, recs in records.items():
+                store = DocStore(docstore_path(targets.get(name) or resolve(SOURCES[name].index_name), docstore))
+                compact_records(recs, store)
+                store.close()
+
+        # 🔁 Quasi-duplicati all'interno di ciascun indice: un solo embedding per cluster
+        if dedup_threshold is not None:
+            for recs in records.values():
+                # i vettori di documento non partecipano: ripetono i campi dei propri chunk
+                texts = ["" if r["metadata"].get("kind") == "doc" else r["text"] for r in recs]
+                signatures = pool.map(minhash, texts, chunksize=64)
+                for record, signature in zip(recs, signatures):
+                    record["signature"] = signature
+
+            before = sum(len(r) for r in records.values())
+            records = dedup_records(records, threshold=dedup_threshold)
+            after = sum(len(r) for r in records.values())
+            print(f"🔁 Deduplica: {before - after} chunk quasi-duplicati su {before}")
+
+        for recs in records.values():
+            for record in recs:
+                record["hash"] = content_hash(record)
+
+        # 2️⃣ Embedding + upsert in parallelo, con budget di rate limit condiviso
+        futures = [pool.submit(_embed_and_upsert, name, recs, options, targets.get(name))
+                   for name, recs in records.items()]
+        stats = [f.result() for f in futures]
+
+    # 📅 Dopo l'upsert e nel file della versione di destinazione: con --rebuild le query lo
+    # leggono solo dopo lo switch dell'alias
+    if "events" in records and options.get("upsert", True) and not options.get("dry_run"):
+        build_date_index(events, targets.get("events") or resolve(SOURCES["events"].index_name))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestione degli export Confindustria Varese su Pinecone")
+    parser.add_argument("exports", nargs="+",
+                        help="sorgenti da indicizzare, nella forma sorgente[:file.json] "
+                             f"(sorgenti: {', '.join(SOURCES)})")
+    parser.add_argument("--batch-size", type=int, default=64,
+                        help="testi per chiamata di embedding (default 64)")
+    parser.add_argument("--upsert-batch-size", type=int, default=40,
+                        help="vettori per upsert Pinecone (default 40)")
+    parser.add_argument("--workers", type=int, default=3,
+                        help="processi paralleli (default 3)")
+    parser.add_argument("--rpm", type=int, default=3000,
+                        help="richieste di embedding al minuto, condivise tra le sorgenti")
+    parser.add_argument("--tpm", type=int, default=1_000_000,
+                        help="token di embedding al minuto, condivisi tra le sorgenti")
+    parser.add_argument("--embedder", default=DEFAULT_EMBEDDER,
+                        help="openai[:modello] o local[:modello] (default da CONFVA_EMBEDDER, "
+                             f"ora {DEFAULT_EMBEDDER}); cambiarlo su un indice esistente richiede --rebuild")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="prepara i record senza chiamare OpenAI né Pinecone")
+    parser.add_argument("--incremental", action="store_true",
+                        help="indicizza solo i vettori nuovi o modificati ed elimina quelli scomparsi "
+                             "dai file indicati (i vettori degli altri file restano)")
+    parser.add_argument("--snapshot", metavar="DIR",
+                        help="scrive anche uno snapshot per sorgente in DIR/<sorgente> (vedi snapshot.py)")
+    parser.add_argument("--no-upsert", action="store_true",
+                        help="non scrive su Pinecone (utile con --snapshot)")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="ricostruisce su nuove versioni degli indici e sposta gli alias a fine ingestione")
+    parser.add_argument("--keep", type=int, default=2,
+                        help="con --rebuild: versioni da conservare per indice, corrente inclusa (default 2)")
+    parser.add_argument("--compact-metadata", action="store_true",
+                        help="nei vettori solo i campi filtrabili; testo e campi dei documenti nel document store")
+    parser.add_argument("--docstore", default=DOCSTORE_DIR,
+                        help=f"cartella dei document store SQLite per --compact-metadata, uno per indice "
+                             f"(default {DOCSTORE_DIR})")
+    parser.add_argument("--no-doc-vectors", action="store_true",
+                        help="non crea il vettore di documento (titolo, oggetto, sintesi, tag) per unid")
+    parser.add_argument("--summaries", nargs="?", const=SUMMARIES_PATH, metavar="DB",
+                        help=f"genera le sintesi dei documenti lunghi (default {SUMMARIES_PATH}); "
+                             "solo per i documenti nuovi o modificati")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="disattiva la deduplica dei chunk quasi-duplicati (all'interno di ciascun indice)")
+    parser.add_argument("--dedup-threshold", type=float, default=THRESHOLD,
+                        help=f"similarità di Jaccard minima tra duplicati (default {THRESHOLD})")
+    args = parser.parse_args(argv)
+    if args.snapshot and args.incremental:
+        parser.error("--snapshot richiede un'ingestione completa: non usarlo con --incremental")
+    if args.rebuild and (args.incremental or args.no_upsert):
+        parser.error("--rebuild richiede un'ingestione completa su Pinecone")
+    if args.no_upsert and not args.snapshot:
+        parser.error("--no-upsert ha senso solo insieme a --snapshot")
+
+    options = {
+        "batch_size": args.batch_size,
+        "upsert_batch_size": args.upsert_batch_size,
+        "incremental": args.incremental,
+        "dry_run": args.dry_run,
+        "snapshot_dir": args.snapshot,
+        "upsert": not args.no_upsert,
+        "embedder": args.embedder,
+    }
+    jobs = parse_exports(args.exports)
+    targets = rebuild_targets(jobs) if args.rebuild else {}
+    for name, target in targets.items():
+        print(f"🔨 [{name}] ricostruzione su {target}")
+
+    dedup_threshold = None if args.no_dedup else args.dedup_threshold
+    stats = run(jobs, args.workers, args.rpm, args.tpm, options,
+                dedup_threshold=dedup_threshold, targets=targets,
+                docstore=args.docstore if args.compact_metadata else None,
+                doc_vectors=not args.no_doc_vectors,
+                summaries=args.summaries)
+
+    for s in stats:
+        print(f"✔️ [{s['source']}] {s['index']}: {s['records']} vettori, "
+              f"{s['embedded']} indicizzati, {s['skipped']} invariati, {s['deleted']} eliminati")
+
+    # Solo se tutte le sorgenti sono andate a buon fine: le query passano alle nuove versioni
+    if targets and not args.dry_run:
+        promote(targets, stats, keep=args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import hashlib
+import multiprocessing
+from functools import partial
+
+from openai import OpenAI, RateLimitError, APIConnectionError
+from pinecone import Pinecone, ServerlessSpec
+
+from preprocess import decode_field, preprocess_items
+from index_alias import resolve
+from embedders import EMBED_MODEL, EMBED_DIM, get_embedder, register_index, index_info
+
+# ======================================================================
+#  CONFIGURAZIONE
+# ======================================================================
+
+STATE_DIR = ".ingest_state"
+
+# I client vengono creati solo quando servono: un dry-run non richiede chiavi
+_client = None
+_pc = None
+
+
+def get_openai() -> OpenAI:
+    global _client
+    if _client is None:
+        _client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    return _client
+
+
+def get_pinecone() -> Pinecone:
+    global _pc
+    if _pc is None:
+        _pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return _pc
+
+
+# ======================================================================
+#  FUNZIONI DI UTILITÀ
+# ======================================================================
+
+def decode(s: str) -> str:
+    """Decodifica stringhe URL-encoded come 'abc%20def' (ed entità/tag HTML)."""
+    return decode_field(s)
+
+
+def chunk_text(text: str, max_chars: int = 2000) -> list[str]:
+    """Spezzetta il testo in blocchi di dimensione massima."""
+    return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
+
+
+def estimate_tokens(text: str) -> int:
+    """Stima grossolana dei token (≈ 4 caratteri per token)."""
+    return max(1, len(text) // 4)
+
+
+def content_hash(record: dict) -> str:
+    """Hash del testo e dei metadati di un record, usato dall'ingestione incrementale."""
+    payload = json.dumps(
+        {"text": record["text"], "metadata": record["metadata"]},
+        sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+# ======================================================================
+#  RATE LIMIT CONDIVISO TRA PROCESSI
+# ======================================================================
+
+class RateLimiter:
+    """
+    Token bucket sulle API di embedding, condiviso tra tutti i processi
+    dell'ingestione: limita sia le richieste al minuto sia i token al minuto.
+    Va creato nel processo padre e passato ai worker come initarg.
+    """
+
+    def __init__(self, requests_per_minute: int = 3000, tokens_per_minute: int = 1_000_000):
+        self.rpm = float(requests_per_minute)
+        self.tpm = float(tokens_per_minute)
+        self._lock = multiprocessing.Lock()
+        # [richieste disponibili, token disponibili, ultimo aggiornamento]
+        self._state = multiprocessing.RawArray("d", [self.rpm, self.tpm, time.time()])
+
+    def acquire(self, tokens: int = 0):
+        tokens = min(tokens, self.tpm)
+        while True:
+            with self._lock:
+                now = time.time()
+                elapsed = max(0.0, now - self._state[2])
+                requests = min(self.rpm, self._state[0] + elapsed * self.rpm / 60)
+                available = min(self.tpm, self._state[1] + elapsed * self.tpm / 60)
+                self._state[2] = now
+
+                if requests >= 1 and available >= tokens:
+                    self._state[0] = requests - 1
+                    self._state[1] = available - tokens
+                    return
+
+                self._state[0] = requests
+                self._state[1] = available
+                wait = max(
+                    (1 - requests) * 60 / self.rpm,
+                    (tokens - available) * 60 / self.tpm
+                )
+            time.sleep(max(wait, 0.01))
+
+
+# ======================================================================
+#  EMBEDDING + UPSERT
+# ======================================================================
+
+def embed_batch(texts: list[str], limiter: RateLimiter = None, retries: int = 5,
+                embedder=None) -> list[list[float]]:
+    """
+    Embedding di più testi con una sola chiamata. Con l'embedder OpenAI
+    (default) passa dal rate limiter e ritenta sugli errori transitori;
+    un embedder locale calcola direttamente.
+    """
+    embedder = embedder or get_embedder()
+    if not embedder.remote:
+        return embedder.embed(texts)
+    for attempt in range(retries):
+        if limiter is not None:
+            limiter.acquire(sum(estimate_tokens(t) for t in texts))
+        try:
+            return embedder.embed(texts)
+        except (RateLimitError, APIConnectionError) as e:
+            if attempt == retries - 1:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Embedding ritentato tra {delay}s: {e}")
+            time.sleep(delay)
+
+
+def embed_text(text: str) -> list:
+    """Embedding di un singolo testo."""
+    return embed_batch([text])[0]
+
+
+def ensure_index(index_name: str, dimension: int = EMBED_DIM, spec: str = None):
+    """
+    Crea l'indice Pinecone se non esiste e lo restituisce. Su un indice
+    esistente l'embedder (spec) deve essere quello con cui è stato
+    costruito: due modelli con la stessa dimensione hanno spazi diversi.
+    """
+    pc = get_pinecone()
+    if index_name not in [idx["name"] for idx in pc.list_indexes()]:
+        pc.create_index(
+            name=index_name,
+            dimension=dimension,
+            metric="cosine",
+            spec=ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+    elif pc.describe_index(index_name).dimension != dimension:
+        raise ValueError(f"L'indice {index_name} ha dimensione {pc.describe_index(index_name).dimension}, "
+                         f"l'embedder {dimension}: per cambiare embedder usa --rebuild")
+    elif spec and index_info(index_name)["embedder"] != spec:
+        raise ValueError(f"L'indice {index_name} è stato costruito con {index_info(index_name)['embedder']}, "
+                         f"non con {spec}: per cambiare embedder usa --rebuild")
+    return pc.Index(index_name)
+
+
+def wait_for_count(index, expected: int, timeout: float = 120):
+    """Attende che l'indice riporti almeno expected vettori (consistenza eventuale)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if index.describe_index_stats().get("total_vector_count", 0) >= expected:
+            return True
+        time.sleep(2)
+    return False
+
+
+def upsert_in_batches(index, vectors, batch_size=50):
+    """Esegue l'upsert in batch per evitare limiti Pinecone."""
+    for i in range(0, len(vectors), batch_size):
+        batch = vectors[i:i+batch_size]
+        index.upsert(batch)
+        print(f"Upsertati {len(batch)} vettori (batch {i//batch_size + 1})")
+
+
+# ======================================================================
+#  STATO INCREMENTALE
+# ======================================================================
+
+class IngestState:
+    """
+    Hash dei vettori già indicizzati, per indice, salvati su disco, con il
+    file di export da cui viene ciascun vettore: un'ingestione di un solo
+    file (news:notiziario_2025.json) tocca solo i vettori di quel file.
+      {"hashes": {id: hash}, "files": {id: file}}
+    """
+
+    def __init__(self, index_name: str, state_dir: str = STATE_DIR):
+        self.path = os.path.join(state_dir, f"{index_name}.json")
+        self.hashes = {}
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            # formato precedente: solo {id: hash}, senza file
+            self.hashes, self.files = (data["hashes"], data["files"]) if "hashes" in data else (data, {})
+
+    def changed(self, records: list[dict]) -> list[dict]:
+        return [r for r in records if self.hashes.get(r["id"]) != r["hash"]]
+
+    def stale_ids(self, records: list[dict]) -> list[str]:
+        """Vettori scomparsi dai file di questa ingestione; quelli degli altri file restano."""
+        current = {r["id"] for r in records}
+        files = {r.get("file") for r in records}
+        return [vid for vid in self.hashes if vid not in current and self.files.get(vid) in files]
+
+    def save(self, records: list[dict]):
+        files = {r.get("file") for r in records}
+        kept = [vid for vid in self.hashes if self.files.get(vid) not in files]
+        self.hashes = {**{vid: self.hashes[vid] for vid in kept}, **{r["id"]: r["hash"] for r in records}}
+        self.files = {**{vid: self.files[vid] for vid in kept if vid in self.files},
+                      **{r["id"]: r.get("file") for r in records}}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"hashes": self.hashes, "files": self.files}, f)
+        os.replace(tmp, self.path)
+
+
+# ======================================================================
+#  PIPELINE
+# ======================================================================
+
+def prepare_records(source, paths: list[str], pool=None, doc_vectors: bool = True) -> list[dict]:
+    """
+    Legge uno o più export JSON di una sorgente e produce i record da
+    indicizzare: {"id", "text", "metadata", "hash"}, chunk più (con
+    doc_vectors) un vettore di documento per unid. Lavoro solo CPU:
+    con un pool di processi preprocessing e chunking girano in parallelo.
+    """
+    items, files = [], {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = [item for item in json.load(f) if item.get("unid") != "-1"]
+        items.extend(loaded)
+        for item in loaded:
+            files.setdefault(item.get("unid"), os.path.basename(path))
+
+    items = preprocess_items(source, items, pool=pool)
+
+    map_ = (lambda fn, it: pool.map(fn, it, chunksize=64)) if pool is not None else map
+    build = partial(source.all_records, doc_vectors=doc_vectors)
+    records = [r for item_records in map_(build, items) for r in item_records]
+
+    for record in records:
+        # file di export di provenienza: delimita eliminazioni e pulizie (IngestState, doc_store)
+        record["file"] = files.get(record["metadata"].get("unid"))
+        record["hash"] = content_hash(record)
+    return records
+
+
+def embed_and_upsert(source, records: list[dict], limiter: RateLimiter = None,
+                     batch_size: int = 64, upsert_batch_size: int = 40,
+                     incremental: bool = False, dry_run: bool = False,
+                     snapshot_dir: str = None, upsert: bool = True,
+                     index_name: str = None, embedder: str = None) -> dict:
+    """
+    Calcola gli embedding dei record a batch e li carica sull'indice della
+    sorgente man mano, così la memoria resta limitata a un batch.
+    L'indice è quello puntato dall'alias della sorgente, salvo index_name
+    esplicito (ricostruzione su una nuova versione, vedi index_alias.py).
+    Con snapshot_dir i vettori vengono scritti anche in uno snapshot
+    (vedi snapshot.py); con upsert=False solo nello snapshot.
+    embedder: 'openai[:modello]' o 'local[:modello]' (vedi embedders.py).
+    """
+    index_name = index_name or resolve(source.index_name)
+    state = IngestState(index_name)
+    todo = state.changed(records) if incremental else records
+    stale = state.stale_ids(records) if incremental else []
+
+    stats = {
+        "source": source.name,
+        "index": index_name,
+        "records": len(records),
+        "embedded": 0 if dry_run else len(todo),
+        "skipped": len(records) - len(todo),
+        "deleted": 0 if dry_run or not upsert else len(stale),
+    }
+
+    if dry_run:
+        print(f"[{source.name}] dry-run: {len(todo)} vettori da indicizzare, "
+              f"{stats['skipped']} invariati, {len(stale)} da eliminare")
+        return stats
+
+    embedder = get_embedder(embedder)
+    index = ensure_index(index_name, dimension=embedder.dimension, spec=embedder.spec) if upsert else None
+    if index:
+        register_index(index_name, embedder.spec, embedder.dimension)
+
+    writer = None
+    if snapshot_dir:
+        from snapshot import SnapshotWriter
+        writer = SnapshotWriter(os.path.join(snapshot_dir, source.name), index_name,
+                                embedder.dimension, embed_model=embedder.spec)
+
+    pending = []
+    for i in range(0, len(todo), batch_size):
+        batch = todo[i:i+batch_size]
+        embeddings = embed_batch([r["text"] for r in batch], limiter, embedder=embedder)
+        vectors = [{
+            "id": record["id"],
+            "values": embedding,
+            "metadata": record["metadata"]
+        } for record, embedding in zip(batch, embeddings)]
+
+        if writer:
+            # metadati compatti (vedi doc_store.py): lo snapshot conserva comunque il testo del chunk
+            writer.write([v if "text" in v["metadata"] else
+                          {**v, "metadata": {**v["metadata"], "text": record["text"]}}
+                          for v, record in zip(vectors, batch)])
+        if index:
+            pending.extend(vectors)
+            while len(pending) >= upsert_batch_size:
+                index.upsert(pending[:upsert_batch_size])
+                pending = pending[upsert_batch_size:]
+        print(f"[{source.name}] {min(i + batch_size, len(todo))}/{len(todo)} vettori")
+
+    if writer:
+        writer.close()
+
+    if index:
+        if pending:
+            index.upsert(pending)
+        for i in range(0, len(stale), 1000):
+            index.delete(ids=stale[i:i+1000])
+        state.save(records)
+
+    return stats
@@ -0,0 +1,114 @@
+import re
+import math
+import time
+import threading
+from collections import Counter, defaultdict, OrderedDict
+
+# ======================================================================
+#  CANDIDATI LESSICALI
+#  Ricerca BM25 sui chunk del document store e cache delle ultime
+#  domande: entrambi rispondono in locale mentre l'embedding della query
+#  è ancora in volo, così il recupero può partire subito.
+# ======================================================================
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_STOPWORDS = {
+    "il", "lo", "la", "i", "gli", "le", "un", "uno", "una", "di", "a", "da", "in", "con",
+    "su", "per", "tra", "fra", "e", "o", "che", "del", "della", "dei", "delle", "degli",
+    "al", "alla", "ai", "alle", "nel", "nella", "nei", "nelle", "sul", "sulla", "è",
+    "sono", "come", "quali", "quale", "cosa", "mi", "ci", "si", "non", "più", "l", "d",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    return [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(_WORD_RE.findall(query.lower()))
+
+
+class BM25Index:
+    """Indice BM25 in memoria sui chunk: (unid, chunk_index, source)."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.keys = []
+        self.lengths = []
+        self.postings = defaultdict(list)      # termine → [(posizione, tf)]
+        self.ready = False
+
+    def build(self, rows):
+        """rows: iterabile di (unid, chunk_index, source, text)."""
+        for unid, chunk_index, source, text in rows:
+            terms = Counter(tokenize(text))
+            position = len(self.keys)
+            self.keys.append((unid, chunk_index, source))
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((position, tf))
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+        self.ready = True
+        return self
+
+    def search(self, query: str, top_k: int = 5) -> list[tuple]:
+        """[(score, unid, chunk_index, source)] in ordine di punteggio."""
+        if not self.ready or not self.keys:
+            return []
+        n = len(self.keys)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.avg_length)
+                scores[position] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda x: -x[1])[:top_k]
+        return [(score, *self.keys[position]) for position, score in best]
+
+
+def build_in_background(stores: list) -> BM25Index:
+    """Costruisce l'indice BM25 dai document store in un thread: finché non è pronto non restituisce nulla."""
+    index = BM25Index()
+    threading.Thread(target=lambda: index.build(row for store in stores for row in store.iter_chunks()),
+                     name="bm25-build", daemon=True).start()
+    return index
+
+
+def is_confident(hits: list[tuple], min_score: float = 5.0, min_ratio: float = 1.5) -> bool:
+    """Primo risultato lessicale netto: punteggio alto e staccato dal secondo."""
+    if not hits or hits[0][0] < min_score:
+        return False
+    return len(hits) == 1 or hits[0][0] >= min_ratio * hits[1][0]
+
+
+class CandidateCache:
+    """Ultimi documenti recuperati per domanda normalizzata (LRU con scadenza)."""
+
+    def __init__(self, capacity: int = 256, ttl: float = 3600):
+        self.capacity = capacity
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str):
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, query: str, docs: list):
+        key = normalize_query(query)
+        with self._lock:
+            self._data[key] = (time.time(), docs)
+            self._data.move_to_end(key)
+            if len(self._data) > self.capacity:
+                self._data.popitem(last=False)
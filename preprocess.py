@@ -0,0 +1,150 @@
+import re
+import html
+import unicodedata
+from collections import Counter
+from urllib.parse import unquote
+
+# ======================================================================
+#  PREPROCESSING DEI TESTI
+#  Decodifica URL/HTML/entità, pulizia degli spazi, normalizzazione
+#  dell'italiano e rimozione delle righe boilerplate ripetute tra i
+#  documenti di un export. Il lavoro per elemento gira su un process pool.
+# ======================================================================
+
+_PERCENT_RE = re.compile(r"%[0-9A-Fa-f]{2}")
+# solo tag veri (<nome ...>, </nome>, commenti): "3 < 5 e 7 > 2" resta com'è
+_DROP_BLOCK_RE = re.compile(r"<(script|style)\b[^<>]*>.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_BREAK_RE = re.compile(r"<br\b[^<>]*>|</(p|div|li|tr|h[1-6]|ul|ol|table)\s*>", re.IGNORECASE)
+_TAG_RE = re.compile(r"</?[A-Za-z][A-Za-z0-9-]*(?:\s[^<>]*)?/?>|<!--.*?-->", re.DOTALL)
+_SPACES_RE = re.compile(r"[ \t\f\v]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_INVISIBLE = dict.fromkeys(map(ord, "\u200b\u200c\u200d\u2060\ufeff"), None)
+
+_TYPOGRAPHY = str.maketrans({
+    "’": "'", "‘": "'", "´": "'",
+    "“": '"', "”": '"', "«": '"', "»": '"',
+    "–": "-", "—": "-",
+    "…": "...",
+})
+
+# Accenti scritti con l'apostrofo nei testi inseriti a mano ("perche'", "E' ")
+_ACCENT_WORDS = {
+    "perche": "perché", "poiche": "poiché", "affinche": "affinché", "benche": "benché",
+    "nonche": "nonché", "finche": "finché", "sicche": "sicché",
+    "piu": "più", "giu": "giù", "gia": "già", "puo": "può", "cioe": "cioè",
+}
+_ACCENT_WORDS_RE = re.compile(r"\b(" + "|".join(_ACCENT_WORDS) + r")'(?=\W|$)", re.IGNORECASE)
+_ITA_SUFFIX_RE = re.compile(r"(\w{2,}it)a'(?=\W|$)")      # attivita' → attività
+_E_ACCENT_RE = re.compile(r"(^|[.!?:]\s+)E' ", re.MULTILINE)
+
+
+def _accent_word(m):
+    word = _ACCENT_WORDS[m.group(1).lower()]
+    return word.capitalize() if m.group(1)[0].isupper() else word
+
+
+_STOPWORDS = {
+    "it": {"il", "lo", "la", "gli", "le", "di", "del", "della", "che", "e", "è", "per",
+           "con", "non", "una", "un", "sono", "nel", "nella", "alle", "delle", "dei"},
+    "en": {"the", "of", "and", "to", "in", "is", "for", "with", "that", "on", "are",
+           "this", "by", "from", "be", "as", "at", "an", "or"},
+}
+
+
+def decode_field(s) -> str:
+    """Decodifica un campo dell'export: URL-encoding, entità e tag HTML."""
+    if not isinstance(s, str):
+        return ""
+    # %2520 → %20 → spazio: al massimo due passaggi
+    for _ in range(2):
+        if not _PERCENT_RE.search(s):
+            break
+        s = unquote(s)
+    s = html.unescape(s)
+    if "<" in s:
+        s = _DROP_BLOCK_RE.sub(" ", s)
+        s = _BREAK_RE.sub("\n", s)
+        s = _TAG_RE.sub(" ", s)
+    return s
+
+
+def normalize_whitespace(s: str) -> str:
+    s = s.translate(_INVISIBLE).replace("\u00a0", " ").replace("\r\n", "\n").replace("\r", "\n")
+    s = _SPACES_RE.sub(" ", s)
+    s = "\n".join(line.strip() for line in s.split("\n"))
+    return _BLANK_LINES_RE.sub("\n\n", s).strip()
+
+
+def detect_language(s: str) -> str:
+    """Riconoscimento grezzo it/en tramite le parole funzionali."""
+    words = re.findall(r"\w+", s.lower())
+    counts = {lang: sum(1 for w in words if w in stop) for lang, stop in _STOPWORDS.items()}
+    return "en" if counts["en"] > counts["it"] else "it"
+
+
+def normalize_language(s: str, lang: str = None) -> str:
+    s = unicodedata.normalize("NFC", s).translate(_TYPOGRAPHY)
+    if (lang or detect_language(s)) == "it":
+        s = _ACCENT_WORDS_RE.sub(_accent_word, s)
+        s = _ITA_SUFFIX_RE.sub(r"\1à", s)
+        s = _E_ACCENT_RE.sub(r"\1È ", s)
+    return s
+
+
+def clean_field(s) -> str:
+    """Pipeline completa per un campo: decodifica, spazi, normalizzazione."""
+    return normalize_language(normalize_whitespace(decode_field(s)))
+
+
+# ======================================================================
+#  BOILERPLATE
+# ======================================================================
+
+def _line_key(line: str) -> str:
+    return line.strip().lower()
+
+
+def find_boilerplate(texts: list[str], min_docs: int = 5, min_ratio: float = 0.05,
+                     min_chars: int = 20) -> set[str]:
+    """Righe (normalizzate) ripetute in molti documenti: firme, footer, disclaimer."""
+    counts = Counter()
+    for text in texts:
+        counts.update({_line_key(l) for l in text.split("\n") if len(l.strip()) >= min_chars})
+    limit = max(min_docs, min_ratio * len(texts))
+    return {line for line, n in counts.items() if n >= limit}
+
+
+def strip_boilerplate(text: str, boilerplate: set[str]) -> str:
+    if not boilerplate or not text:
+        return text
+    lines = [l for l in text.split("\n") if _line_key(l) not in boilerplate]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+
+# ======================================================================
+#  STAGE DI PREPROCESSING
+# ======================================================================
+
+def clean_item(item: dict) -> dict:
+    """Copia dell'elemento con tutti i campi testuali ripuliti."""
+    return {k: clean_field(v) if isinstance(v, str) else v for k, v in item.items()}
+
+
+def preprocess_items(source, items: list[dict], pool=None, chunksize: int = 64) -> list[dict]:
+    """
+    Ripulisce gli elementi di un export (in parallelo se viene passato un
+    pool di processi) e rimuove dai campi lunghi della sorgente le righe
+    boilerplate comuni a molti documenti.
+    """
+    if pool is not None:
+        cleaned = list(pool.map(clean_item, items, chunksize=chunksize))
+    else:
+        cleaned = [clean_item(item) for item in items]
+
+    for field in source.body_fields:
+        boilerplate = find_boilerplate([item.get(field) or "" for item in cleaned])
+        if boilerplate:
+            for item in cleaned:
+                if item.get(field):
+                    item[field] = strip_boilerplate(item[field], boilerplate)
+    return cleaned
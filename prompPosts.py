@@ -5,17 +5,20 @@ from pinecone import Pinecone, ServerlessSpec
 from urllib.parse import unquote
 from datetime import datetime
 
+from index_alias import resolve
+from embedders import index_dimension, index_embedder
+
 # 🔑 Client OpenAI e Pinecone
 client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
 
-INDEX_NAME = "confindustria-posts"
+INDEX_NAME = resolve("confindustria-posts")
 
 # ✅ Crea indice solo se non esiste
 if INDEX_NAME not in [idx["name"] for idx in pc.list_indexes()]:
     pc.create_index(
         name=INDEX_NAME,
-        dimension=1536,   # text-embedding-3-small produce vettori di 1536 dimensioni
+        dimension=index_dimension(INDEX_NAME),   # 1536 per text-embedding-3-small
         metric="cosine",
         spec=ServerlessSpec(cloud="aws", region="us-east-1")
     )
@@ -45,11 +48,7 @@ def build_text(item):
     return "\n".join([p for p in parts if p])
 
 def embed_text(text: str) -> list:
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+    return index_embedder(INDEX_NAME).embed([text])[0]
 
 def chunk_text(text: str, max_chars: int = 2000) -> list[str]:
     return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
@@ -103,10 +102,7 @@ def ingest_json(path):
 
 def search_and_recompose(query: str, top_k: int = 5):
     # 1. Embedding della query
-    query_embedding = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=query
-    ).data[0].embedding
+    query_embedding = embed_text(query)
 
     # 2. Query su Pinecone
     results = index.query(
@@ -115,10 +111,12 @@ def search_and_recompose(query: str, top_k: int = 5):
         include_metadata=True
     )
 
-    # 3. Raggruppa chunk per documento
+    # 3. Raggruppa chunk per documento (i vettori di documento, kind = "doc", non hanno chunk)
     docs = {}
     for match in results["matches"]:
         metadata = match["metadata"]
+        if metadata.get("kind") == "doc":
+            continue
         unid = metadata.get("unid")
         if unid not in docs:
             docs[unid] = {
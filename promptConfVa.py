@@ -1,36 +1,212 @@
 import os
+import re
 import json
+import time
+import asyncio
+import inspect
+import threading
 from datetime import datetime
-from openai import OpenAI
+from openai import AsyncOpenAI
 from pinecone import Pinecone, ServerlessSpec
 from urllib.parse import unquote
 
+from dedup import dedup_docs
+from index_alias import AliasResolver
+from doc_store import open_store
+from lexical import BM25Index, build_in_background, is_confident, CandidateCache
+from embedders import index_embedder, index_dimension
+from event_dates import load_date_index, is_event_query, parse_date_query, in_range
+from summaries import open_summaries, text_hash
+
 # ======================================================================
 #  INIT OpenAI + Pinecone
+#  Client, document store e sintesi vengono aperti al primo uso: importare
+#  il modulo (evaluate.py sugli snapshot) non richiede chiavi né tocca gli
+#  store correnti.
 # ======================================================================
 
-client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+_aclient = None
+_pc = None
+
+
+def get_aclient() -> AsyncOpenAI:
+    global _aclient
+    if _aclient is None:
+        _aclient = AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"])
+    return _aclient
+
+
+def get_pc() -> Pinecone:
+    global _pc
+    if _pc is None:
+        _pc = Pinecone(api_key=os.environ["PINECONE_API_KEY"])
+    return _pc
 
-# I TRE INDICI USATI NEL RAG
+
+CHAT_MODEL = "gpt-4.1-mini"
+QUERY_TIMEOUT = 10        # secondi per indice: un indice lento non blocca la risposta
+
+# I TRE INDICI USATI NEL RAG (alias: la versione corrente è in index_aliases.json)
 INDEXES = {
     "posts": "confindustria-posts",
     "news": "confindustria-news",
     "eventi": "confindustria-eventi"
 }
 
-# CREA GLI INDICI SE NON ESISTONO
-for idx in INDEXES.values():
-    if idx not in [i["name"] for i in pc.list_indexes()]:
-        pc.create_index(
-            name=idx,
-            dimension=1536,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1")
-        )
+aliases = AliasResolver()
+
+# Indici Pinecone, istanziati al primo uso: chi lavora su snapshot locali
+# (evaluate.py) non tocca Pinecone
+pinecone_indexes = {"names": None, "indexes": {}}
+
+
+def ensure_indexes():
+    """CREA GLI INDICI SE NON ESISTONO"""
+    pc = get_pc()
+    existing = [i["name"] for i in pc.list_indexes()]
+    for idx in INDEXES.values():
+        if aliases.resolve(idx) not in existing:
+            pc.create_index(
+                name=aliases.resolve(idx),
+                dimension=index_dimension(aliases.resolve(idx)),
+                metric="cosine",
+                spec=ServerlessSpec(cloud="aws", region="us-east-1")
+            )
+
+
+# Document store locali (ingestione con --compact-metadata), uno per versione
+# dell'indice: vedi get_doc_stores()
+doc_stores = {"names": None, "stores": {}}
+
+# Corpus fisso al posto di alias e file correnti (evaluate.py): vedi pin_corpus()
+corpus = None
+
+# Sintesi dei documenti (ingestione con --summaries), se presenti: nel prompt
+# solo i primi FULL_TEXT_DOCS documenti vanno a testo pieno. Vedi get_summary_store()
+summary_store = None
+FULL_TEXT_DOCS = 1
+
+# Candidati locali mentre l'embedding della query è in volo: BM25 sui chunk
+# dei document store e cache delle ultime domande
+lexical_index = None
+candidate_cache = CandidateCache()
+LEXICAL_K = 5
+SPECULATIVE_CHECK = 2     # documenti di testa che devono coincidere per tenere la risposta anticipata
+
+# metadata "source" dei vettori → etichetta dell'indice
+SOURCE_LABELS = {
+    "confindustria_varese_post": "posts",
+    "notiziario": "news",
+    "confindustria_varese_eventi": "eventi"
+}
+
+
+def get_doc_stores() -> dict:
+    """
+    Document store delle versioni correnti degli indici, per etichetta: dopo
+    uno switch degli alias si riaprono quelli nuovi e si ricostruisce il BM25.
+    """
+    global lexical_index
+    if corpus is not None:
+        return corpus["stores"]
+    names = {label: aliases.resolve(name) for label, name in INDEXES.items()}
+    if names != doc_stores["names"]:
+        stores = {label: open_store(name) for label, name in names.items()}
+        doc_stores["stores"] = {label: store for label, store in stores.items() if store}
+        doc_stores["names"] = names
+        lexical_index = build_in_background(list(doc_stores["stores"].values())) if doc_stores["stores"] else None
+    return doc_stores["stores"]
+
+
+def hydrate(metadatas: list[dict], label: str = None):
+    """Metadata compatti: testo e campi del documento dallo store del loro indice (__source_index o label)."""
+    for store_label, store in get_doc_stores().items():
+        store.hydrate([m for m in metadatas if (label or m.get("__source_index")) == store_label])
+
+
+def get_summary_store():
+    """Store delle sintesi: quello del corpus fissato, altrimenti il corrente se è stato generato."""
+    global summary_store
+    if corpus is not None:
+        return corpus["summaries"]
+    if summary_store is None:
+        summary_store = open_summaries()
+    return summary_store
+
+
+def pin_corpus(stores: dict, date_index=None, summaries=None):
+    """
+    Fissa il corpus (evaluate.py sugli snapshot): document store per
+    etichetta, indice delle date e sintesi non seguono più alias e file
+    correnti, e il BM25 è costruito subito, in modo sincrono.
+    """
+    global corpus, lexical_index
+    corpus = {"stores": stores, "date_index": date_index, "summaries": summaries}
+    lexical_index = BM25Index().build(row for store in stores.values() for row in store.iter_chunks())
+
+
+def get_pinecone_indexes() -> dict:
+    """Indici correnti: dopo uno switch degli alias (ricostruzione) si passa alle nuove versioni."""
+    # confronto dei nomi risolti: resolve() rilegge il file e consuma aliases.changed()
+    names = {label: aliases.resolve(name) for label, name in INDEXES.items()}
+    if names != pinecone_indexes["names"]:
+        ensure_indexes()
+        pinecone_indexes["indexes"] = {label: get_pc().Index(name) for label, name in names.items()}
+        pinecone_indexes["names"] = names
+    return pinecone_indexes["indexes"]
+
+
+# ======================================================================
+#  EVENT LOOP CONDIVISO
+#  Le varianti async girano su un unico loop in un thread dedicato: i
+#  client async (OpenAI, Pinecone) restano legati a quel loop e le API
+#  sincrone sono un sottile wrapper che vi sottomette le coroutine.
+# ======================================================================
+
+_loop = None
+_loop_lock = threading.Lock()
+_async_indexes = {}
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="rag-loop", daemon=True).start()
+    return _loop
+
+
+def run_sync(coro):
+    """Esegue una coroutine sul loop condiviso e ne attende il risultato."""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        raise
 
-# Istanziare gli indici Pinecone
-pinecone_indexes = {label: pc.Index(name) for label, name in INDEXES.items()}
+
+def get_async_indexes() -> dict:
+    """Client async per gli indici correnti (IndexAsyncio se disponibile nell'SDK)."""
+    indexes = get_pinecone_indexes()
+    pc = get_pc()
+    if not hasattr(pc, "IndexAsyncio"):
+        return indexes
+    result = {}
+    for label, name in INDEXES.items():
+        resolved = aliases.resolve(name)
+        if resolved not in _async_indexes:
+            _async_indexes[resolved] = pc.IndexAsyncio(host=pc.describe_index(resolved).host)
+        result[label] = _async_indexes[resolved]
+    return result
+
+
+async def query_async(index, **kwargs):
+    """query sull'indice: nativa se async, altrimenti sul thread pool del loop."""
+    if inspect.iscoroutinefunction(index.query):
+        return await index.query(**kwargs)
+    return await asyncio.to_thread(index.query, **kwargs)
 
 
 
@@ -56,12 +232,15 @@ def build_text(item):
     ]
     return "\n".join([p for p in parts if p])
 
-def embed_text(text: str):
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+def get_index_embedders() -> dict:
+    """Embedder con cui è stato costruito ciascun indice corrente (vedi embedders.py)."""
+    return {label: index_embedder(aliases.resolve(name)) for label, name in INDEXES.items()}
+
+async def embed_query_async(query: str, embedders: dict = None) -> dict:
+    """Embedding della query per ciascun embedder in uso: {spec: vettore}."""
+    embedders = {e.spec: e for e in (embedders or await asyncio.to_thread(get_index_embedders)).values()}
+    vectors = await asyncio.gather(*(e.embed_async([query]) for e in embedders.values()))
+    return {spec: v[0] for spec, v in zip(embedders, vectors)}
 
 def chunk_text(text: str, max_chars: int = 2000):
     return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
@@ -73,39 +252,113 @@ def chunk_text(text: str, max_chars: int = 2000):
 #  🔎 RICERCA MULTI-INDICE + RICOMPOSIZIONE
 # ======================================================================
 
-def search_and_recompose(query: str, top_k: int = 5):
-    """
-    Cerca la query nei tre indici:
-    - confindustria-posts
-    - confindustria-news
-    - confindustria-eventi
-    Unisce i risultati e ricompone i documenti.
-    """
-
-    # 1️⃣ Embedding query
-    query_embedding = embed_text(query)
+# Chunk recuperati per ciascun documento trovato nel primo passaggio
+CHUNKS_PER_DOC = 3
 
-    all_matches = []
 
-    # 2️⃣ Query su ciascun indice
-    for label, index in pinecone_indexes.items():
-        try:
-            results = index.query(
+async def retrieve_from_index(index, query_embedding, top_k: int, doc_first: bool = True):
+    """
+    Primo passaggio sui vettori di documento (kind = "doc": titolo, oggetto,
+    sintesi, tag), poi solo i chunk dei documenti trovati. Sugli indici
+    senza vettori di documento ricade sulla ricerca diretta dei chunk.
+    """
+    if doc_first:
+        doc_hits = (await query_async(
+            index,
+            vector=query_embedding,
+            top_k=top_k,
+            include_metadata=True,
+            filter={"kind": {"$eq": "doc"}}
+        ))["matches"]
+
+        if doc_hits:
+            unids = [m["metadata"]["unid"] for m in doc_hits]
+            chunk_hits = (await query_async(
+                index,
                 vector=query_embedding,
-                top_k=top_k,
-                include_metadata=True
-            )
+                top_k=len(unids) * CHUNKS_PER_DOC,
+                include_metadata=True,
+                filter={"unid": {"$in": unids}}
+            ))["matches"]
+            chunks = [m for m in chunk_hits if m["metadata"].get("kind") != "doc"]
+            if chunks:
+                return chunks
+
+    results = await query_async(
+        index,
+        vector=query_embedding,
+        top_k=top_k,
+        include_metadata=True
+    )
+    return [m for m in results["matches"] if m["metadata"].get("kind") != "doc"]
 
-            for m in results["matches"]:
-                m["metadata"]["__source_index"] = label
 
-            all_matches.extend(results["matches"])
+async def fetch_metadata(index, ids: list) -> dict:
+    """fetch per id sull'indice (async o sincrono): {id: metadata}."""
+    if inspect.iscoroutinefunction(index.fetch):
+        result = await index.fetch(ids=ids)
+    else:
+        result = await asyncio.to_thread(index.fetch, ids=ids)
+    vectors = result["vectors"] if isinstance(result, dict) else result.vectors
+    return {vid: dict(v["metadata"] if isinstance(v, dict) else v.metadata) for vid, v in vectors.items()}
 
-        except Exception as e:
-            print(f"⚠️ Errore nell'indice {label}: {e}")
+
+async def fetch_siblings(indexes: dict, docs: dict):
+    """
+    Recupera in parallelo i chunk mancanti dei documenti trovati (unid_chunkN);
+    per i chunk eliminati dalla deduplica si legge il chunk tenuto al loro posto.
+    """
+    requests = []
+    for doc in docs.values():
+        missing = [(doc["duplicates"].get(i, f"{doc['unid']}_chunk{i}"), i)
+                   for i in range(int(doc["chunk_total"] or 0)) if i not in doc["chunks"]]
+        if missing and doc["source"] in indexes:
+            requests.append((doc, indexes[doc["source"]], missing))
+
+    results = await asyncio.gather(*(fetch_metadata(index, list({vid for vid, _ in missing}))
+                                     for _, index, missing in requests),
+                                   return_exceptions=True)
+    for (doc, _, missing), result in zip(requests, results):
+        if isinstance(result, Exception):
+            print(f"⚠️ Errore nel recupero dei chunk di {doc['unid']}: {result}")
+            continue
+        hydrate(list(result.values()), doc["source"])
+        for vid, chunk_index in missing:
+            if vid in result:
+                doc["chunks"][chunk_index] = result[vid].get("text")
+
+
+# Eventi al massimo restituiti dall'indice delle date per un intervallo aperto
+# ("prossimi eventi"); un intervallo chiuso ("eventi a marzo") torna intero
+DATE_HITS = 10
+
+
+async def date_matches(index, date_range: tuple, limit: int = DATE_HITS) -> list:
+    """Eventi nell'intervallo di date (vedi event_dates.py), come match in ordine di data."""
+    date_index = corpus["date_index"] if corpus is not None else load_date_index(aliases.resolve(INDEXES["eventi"]))
+    if date_index is None:
+        return []
+    hits = date_index.range(*date_range, limit=limit if date_range[1] is None else None)
+    if not hits:
+        return []
+    metadatas = await fetch_metadata(index, [unid for _, unid in hits])
+    matches = []
+    for _, unid in hits:
+        if unid in metadatas:
+            metadata = metadatas[unid]
+            metadata["__source_index"] = "eventi"
+            matches.append({"id": unid, "score": 0.0, "date_match": True, "metadata": metadata})
+    return matches
+
+
+def group_matches(all_matches: list) -> dict:
+    """Ordina i match per punteggio e li raggruppa per documento."""
 
     # 3️⃣ Ordina per punteggio
-    all_matches = sorted(all_matches, key=lambda x: x["score"], reverse=True)
+    all_matches = sorted(all_matches, key=lambda x: x.get("fused_score", x["score"]), reverse=True)
+
+    # Metadata compatti: testo e campi del documento dal document store
+    hydrate([m["metadata"] for m in all_matches])
 
     # 4️⃣ Raggruppamento chunk per documento
     docs = {}
@@ -122,22 +375,47 @@ def search_and_recompose(query: str, top_k: int = 5):
             docs[unique_key] = {
                 "unid": unid,
                 "source": source,
-                "title": metadata.get("title"),
-                "url": metadata.get("url"),
-                "date": metadata.get("date"),
-                "category": metadata.get("category"),
+                "title": None,
+                "url": None,
+                "date": None,
+                "category": None,
+                "chunk_total": None,
+                "aliases": [],
+                "duplicates": {},
                 "chunks": {}
             }
-
-        chunk_index = metadata.get("chunk_index")
+        doc = docs[unique_key]
+        # gli eventi usano titolo/data; i campi mancanti si completano dai match successivi
+        fields = {
+            "title": metadata.get("title") or metadata.get("titolo"),
+            "url": metadata.get("url"),
+            "date": metadata.get("date") or metadata.get("data"),
+            "category": metadata.get("category"),
+            "chunk_total": metadata.get("chunk_total"),
+        }
+        for key, value in fields.items():
+            if doc[key] is None:
+                doc[key] = value
+
+        chunk_index = metadata.get("chunk_index") or 0
         docs[unique_key]["chunks"][chunk_index] = metadata.get("text")
+        # chunk indicizzati una sola volta per conto di altri documenti (vedi dedup.py)
+        docs[unique_key]["aliases"].extend(a.split("_chunk")[0] for a in metadata.get("aliases", []))
+        # chunk del documento eliminati dalla deduplica: "<chunk_index>=<id del chunk tenuto>"
+        for entry in metadata.get("duplicates", []):
+            index, _, kept_id = entry.partition("=")
+            docs[unique_key]["duplicates"][int(index)] = kept_id
+
+    return docs
 
+
+def recompose(docs: dict) -> list:
     # 5️⃣ Ricomposizione documento completo
     recomposed_docs = []
 
     for key, doc in docs.items():
         ordered = [doc["chunks"][i] for i in sorted(doc["chunks"].keys())]
-        full_text = "\n".join(ordered)
+        full_text = "\n".join(t for t in ordered if t)
 
         recomposed_docs.append({
             "unid": doc["unid"],
@@ -146,10 +424,241 @@ def search_and_recompose(query: str, top_k: int = 5):
             "url": doc["url"],
             "date": doc["date"],
             "category": doc["category"],
-            "content": full_text
+            "aliases": doc["aliases"],
+            "content": full_text,
+            # tutti i chunk del documento presenti e nessuno preso da un quasi-duplicato
+            # (vedi fetch_siblings): content è il testo completo
+            "complete": (bool(doc["chunk_total"]) and len(doc["chunks"]) >= doc["chunk_total"]
+                         and not set(doc["duplicates"]) & set(doc["chunks"]))
         })
 
-    return recomposed_docs
+    # 6️⃣ Un solo documento per gruppo di quasi-duplicati
+    return dedup_docs(recomposed_docs)
+
+
+def lexical_candidates(query: str, top_k: int = LEXICAL_K):
+    """Match BM25 dai document store, nel formato dei match Pinecone, e confidenza del primo."""
+    get_doc_stores()
+    hits = lexical_index.search(query, top_k) if lexical_index else []
+    matches = [{
+        "id": f"{unid}_chunk{chunk_index}",
+        "score": 0.0,
+        "lexical_score": score,
+        "metadata": {
+            "unid": unid,
+            "chunk_index": chunk_index,
+            "__source_index": SOURCE_LABELS.get(source, source)
+        }
+    } for score, unid, chunk_index, source in hits]
+    return matches, is_confident(hits)
+
+
+def merge_candidates(vector_matches: list, *rankings: list, k: int = 60) -> list:
+    """Fusione per rank (RRF) dei match vettoriali con altre classifiche (lessicale, date), in fused_score."""
+    fused = {}
+    ranked_vector = sorted(vector_matches, key=lambda x: x["score"], reverse=True)
+    for ranking in (ranked_vector, *rankings):
+        for rank, match in enumerate(ranking):
+            metadata = match["metadata"]
+            key = (metadata["__source_index"], metadata.get("unid"), metadata.get("chunk_index") or 0)
+            entry = fused.setdefault(key, match)
+            entry["fused_score"] = entry.get("fused_score", 0.0) + 1 / (k + rank + 1)
+            # date_match resta solo sui match dell'indice delle date: un match vettoriale
+            # nell'intervallo conserva il suo punteggio nel profilo (vedi score_profile)
+            if match.get("date_match"):
+                entry["in_date_range"] = True
+    return list(fused.values())
+
+
+# Recupero adattivo: soglie tarate sulla similarità coseno di ciascun embedder
+# (la scala dei punteggi cambia da modello a modello). Per gli embedder non
+# tarati, ad esempio i modelli locali, i tagli adattivi sono disattivati.
+ADAPTIVE_THRESHOLDS = {
+    "openai:text-embedding-3-small": {
+        "min_score": 0.25,    # sotto questa similarità un match non è rilevante
+        "winner_gap": 0.08,   # distacco del primo documento dal secondo oltre cui basta il primo
+        "keep_margin": 0.06,  # altrimenti restano i documenti entro questo margine dal primo
+        "flat_spread": 0.02,  # primi top_k documenti entro questo intervallo: risultati ambigui
+    },
+}
+MAX_TOP_K = 12
+LEXICAL_EXTRA = 1         # documenti trovati solo dal BM25 ammessi oltre a quelli entro keep_margin
+
+
+def adaptive_thresholds(embedders: dict):
+    """Soglie dell'embedder degli indici interrogati; None se non è tarato o se gli indici ne usano più d'uno."""
+    specs = {embedder.spec for embedder in embedders.values()}
+    return ADAPTIVE_THRESHOLDS.get(specs.pop()) if len(specs) == 1 else None
+
+
+def is_vector_match(match: dict) -> bool:
+    """Match con un punteggio di similarità (non solo lessicale o dall'indice delle date)."""
+    return "lexical_score" not in match and not match.get("date_match")
+
+
+def match_key(match: dict) -> tuple:
+    return match["metadata"]["__source_index"], match["metadata"].get("unid")
+
+
+def score_profile(matches: list) -> list:
+    """Miglior punteggio vettoriale per documento, decrescente: [((indice, unid), score)]."""
+    best = {}
+    for m in matches:
+        if not is_vector_match(m):
+            continue
+        key = match_key(m)
+        best[key] = max(best.get(key, m["score"]), m["score"])
+    return sorted(best.items(), key=lambda x: x[1], reverse=True)
+
+
+def is_ambiguous(profile: list, top_k: int, thresholds: dict) -> bool:
+    scores = [score for _, score in profile[:top_k]]
+    return len(scores) >= top_k and scores[0] >= thresholds["min_score"] \
+        and scores[0] - scores[-1] < thresholds["flat_spread"]
+
+
+def adaptive_select(matches: list, thresholds: dict, winner_cut: bool = True) -> list:
+    """
+    Sceglie i documenti da mandare nel prompt in base alla distribuzione dei
+    punteggi: scarta i match sotto min_score; se il primo documento stacca
+    il secondo di winner_gap tiene solo lui (winner_cut=False per le domande
+    che chiedono un elenco, es. eventi per data); altrimenti tiene i
+    documenti entro keep_margin dal primo e al più LEXICAL_EXTRA documenti
+    trovati solo dal BM25. Gli eventi nell'intervallo di date chiesto sono
+    la risposta: restano sempre.
+    """
+    profile = score_profile(matches)
+    relevant = [(key, score) for key, score in profile if score >= thresholds["min_score"]]
+    keep = set()
+    if relevant:
+        top = relevant[0][1]
+        if winner_cut and (len(relevant) == 1 or top - relevant[1][1] >= thresholds["winner_gap"]):
+            keep = {relevant[0][0]}
+        else:
+            keep = {key for key, score in relevant if score >= top - thresholds["keep_margin"]}
+            # i documenti solo lessicali non hanno un punteggio da confrontare con il margine:
+            # passano i primi per BM25, mai accanto a un vincitore netto o senza match rilevanti
+            scored = {key for key, _ in profile}
+            lexical = sorted((m for m in matches if "lexical_score" in m and match_key(m) not in scored),
+                             key=lambda m: m["lexical_score"], reverse=True)
+            keep |= set(list(dict.fromkeys(match_key(m) for m in lexical))[:LEXICAL_EXTRA])
+    return [m for m in matches if m.get("in_date_range") or match_key(m) in keep]
+
+
+async def search_and_recompose_async(query: str, top_k: int = 5, doc_first: bool = True,
+                                     siblings: bool = False, query_embedding=None,
+                                     on_candidates=None, embeddings_task: asyncio.Task = None,
+                                     indexes: dict = None, embedders: dict = None,
+                                     timings: dict = None, adaptive: bool = True, today=None):
+    """
+    Cerca la query nei tre indici:
+    - confindustria-posts
+    - confindustria-news
+    - confindustria-eventi
+    Unisce i risultati e ricompone i documenti. Le query sui tre indici
+    partono insieme; con siblings=True vengono recuperati anche i chunk
+    non trovati dei documenti (ricomposizione completa).
+    Mentre l'embedding è in volo si cercano candidati in locale (cache e
+    BM25); se sono affidabili on_candidates(docs) li riceve subito.
+    Le domande sugli eventi con date ("prossimi eventi", "eventi a marzo")
+    usano anche l'indice delle date: gli eventi fuori intervallo sono scartati.
+    La query viene codificata una volta per embedder: ogni indice è
+    interrogato con quello con cui è stato costruito. embeddings_task è un
+    embed_query_async già avviato dal chiamante. indexes/embedders
+    sostituiscono gli indici correnti (es. LocalIndex sugli snapshot);
+    timings riceve la durata delle fasi in secondi; today fissa la data di
+    riferimento delle domande con date (default oggi).
+    Con adaptive=True top_k è solo il punto di partenza, se l'embedder degli
+    indici ha soglie tarate: vedi adaptive_select.
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
+    # 1️⃣ Embedding query (uno per embedder), e intanto candidati locali.
+    # Alias, schede degli indici e chiamate di controllo di Pinecone (list_indexes,
+    # describe_index) sono bloccanti: fuori dal loop
+    embedders = embedders or await asyncio.to_thread(get_index_embedders)
+    own_task = query_embedding is None and embeddings_task is None
+    if own_task:
+        embeddings_task = asyncio.create_task(embed_query_async(query, embedders))
+
+    try:
+        lexical_matches, confident = await asyncio.to_thread(lexical_candidates, query)
+        early_docs = candidate_cache.get(query)
+        if early_docs is None and confident:
+            early_docs = recompose(group_matches(lexical_matches))
+        if early_docs and on_candidates:
+            on_candidates(early_docs)
+
+        query_embeddings = await embeddings_task if query_embedding is None else None
+    finally:
+        if own_task and not embeddings_task.done():
+            embeddings_task.cancel()
+    timings["embed"] = time.perf_counter() - started
+
+    # 2️⃣ Query su ciascun indice, in parallelo (più l'indice delle date)
+    stage = time.perf_counter()
+    indexes = indexes or await asyncio.to_thread(get_async_indexes)
+    date_range = parse_date_query(query, today) if is_event_query(query) and "eventi" in indexes else None
+    date_task = asyncio.create_task(date_matches(indexes["eventi"], date_range)) if date_range else None
+
+    async def query_indexes(k: int) -> list:
+        results = await asyncio.gather(*(
+            asyncio.wait_for(retrieve_from_index(
+                index,
+                query_embedding if query_embedding is not None else query_embeddings[embedders[label].spec],
+                k, doc_first=doc_first
+            ), QUERY_TIMEOUT)
+            for label, index in indexes.items()
+        ), return_exceptions=True)
+
+        matches_found = []
+        for label, matches in zip(indexes, results):
+            if isinstance(matches, Exception):
+                print(f"⚠️ Errore nell'indice {label}: {matches!r}")
+                continue
+            for m in matches:
+                m["metadata"]["__source_index"] = label
+            matches_found.extend(matches)
+        return matches_found
+
+    thresholds = adaptive_thresholds({label: embedders[label] for label in indexes}) if adaptive else None
+    all_matches = await query_indexes(top_k)
+    # punteggi piatti: nessun documento si distingue, si allarga la ricerca
+    if thresholds and top_k < MAX_TOP_K and is_ambiguous(score_profile(all_matches), top_k, thresholds):
+        all_matches = await query_indexes(min(top_k * 2, MAX_TOP_K))
+
+    timings["retrieve"] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    rankings = [lexical_matches]
+    if date_task:
+        try:
+            rankings.append(await date_task)
+        except Exception as e:
+            print(f"⚠️ Errore nell'indice delle date: {e!r}")
+    rankings = [r for r in rankings if r]
+    if rankings:
+        all_matches = merge_candidates(all_matches, *rankings)
+    if thresholds:
+        all_matches = adaptive_select(all_matches, thresholds, winner_cut=date_range is None)
+
+    docs = group_matches(all_matches)
+    if date_range:
+        docs = {key: doc for key, doc in docs.items()
+                if doc["source"] != "eventi" or in_range(doc["date"], date_range)}
+    if siblings:
+        await fetch_siblings(indexes, docs)
+    result = recompose(docs)
+    candidate_cache.put(query, result)
+    timings["recompose"] = time.perf_counter() - stage
+    return result
+
+
+def search_and_recompose(query: str, top_k: int = 5, doc_first: bool = True, siblings: bool = False,
+                         adaptive: bool = True):
+    return run_sync(search_and_recompose_async(query, top_k=top_k, doc_first=doc_first,
+                                               siblings=siblings, adaptive=adaptive))
 
 
 
@@ -157,9 +666,7 @@ def search_and_recompose(query: str, top_k: int = 5):
 #  PROMPTING GPT
 # ======================================================================
 
-def prompt_with_index(query: str, top_k: int = 5):
-
-    docs = search_and_recompose(query, top_k=top_k)
+def build_prompt(query: str, docs: list, history: list = None) -> str:
 
     context = "\n\n".join([
         f"🔹 SORGENTE: {doc['source']}\n"
@@ -173,12 +680,14 @@ def prompt_with_index(query: str, top_k: int = 5):
     date_now = datetime.today()
     date_now_formatted = date_now.strftime("%d/%m/%Y")
 
-    prompt = f"""
+    conversation = f"\nConversazione precedente:\n{format_history(history)}\n" if history else ""
+
+    return f"""
 Sei un assistente intelligente che risponde usando i documenti di Confindustria Varese provenienti da:
 - confindustria-posts
 - confindustria-news
 - confindustria-eventi
-
+{conversation}
 Domanda utente: {query}
 
 Documenti rilevanti:
@@ -187,13 +696,258 @@ Documenti rilevanti:
 Rispondi in modo chiaro, conciso e indica sempre la SORGENTE delle informazioni. Qualora sia indicato, specifica sempre la URL Non cercare mai informazioni oltre quelle contentute nel RAG. Quando sono richieste informazioni future tieni conto che la data odierna è {date_now_formatted}. 
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[{"role": "user", "content": prompt}]
+
+def current_text(doc: dict):
+    """
+    Testo completo attuale del documento: dal document store (che conserva
+    anche i chunk deduplicati) o, senza store, dalla ricomposizione se è
+    completa, cioè con siblings=True e senza chunk deduplicati.
+    """
+    store = get_doc_stores().get(doc["source"])
+    text = store.document_text(doc["unid"]) if store else None
+    if text is None and doc.get("complete"):
+        text = doc["content"]
+    return text
+
+
+def fresh_summary(doc: dict, stored: tuple):
+    """La sintesi (hash, testo) solo se è stata generata dal testo attuale del documento."""
+    if stored is None:
+        return None
+    text = current_text(doc)
+    return stored[1] if text is not None and text_hash(text) == stored[0] else None
+
+
+def context_docs(docs: list, full_text: int = FULL_TEXT_DOCS) -> list:
+    """
+    Documenti per il prompt: i primi full_text interi, gli altri con la
+    sintesi se esiste ed è aggiornata (stesso hash del testo attuale).
+    """
+    store = get_summary_store()
+    if store is None or len(docs) <= full_text:
+        return docs
+    stored = store.get(doc["unid"] for doc in docs[full_text:])
+    result = docs[:full_text]
+    for doc in docs[full_text:]:
+        summary = fresh_summary(doc, stored.get(doc["unid"]))
+        result.append({**doc, "content": f"(sintesi) {summary}"} if summary else doc)
+    return result
+
+
+async def open_stream(query: str, docs: list, history: list = None):
+    return await get_aclient().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": build_prompt(query, context_docs(docs), history)}],
+        stream=True
     )
 
-    #print("\n--- RISPOSTA ---\n")
-    print(response.choices[0].message.content)
+
+async def discard_stream(task: asyncio.Task):
+    task.cancel()
+    try:
+        stream = await task
+    except (asyncio.CancelledError, Exception):
+        return
+    await stream.close()
+
+
+def same_top(early_docs: list, docs: list, n: int = SPECULATIVE_CHECK) -> bool:
+    early = {(d["source"], d["unid"]) for d in early_docs}
+    return bool(docs) and all((d["source"], d["unid"]) in early for d in docs[:n])
+
+
+async def stream_answer(query: str, top_k: int = 5, speculative: bool = True,
+                        docs: list = None, history: list = None,
+                        embeddings_task: asyncio.Task = None, on_docs=None):
+    """
+    Generatore async dei frammenti della risposta, in streaming. Con
+    speculative=True, se i candidati locali sono affidabili la richiesta di
+    completion parte subito con quelli; viene tenuta solo se i primi
+    documenti della ricerca vettoriale coincidono, altrimenti si annulla.
+    Con docs già recuperati (turno che riusa i documenti) la ricerca è
+    saltata; altrimenti on_docs(docs) riceve i documenti recuperati.
+    """
+    if docs is not None:
+        stream = await open_stream(query, docs, history)
+        try:
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.close()
+        return
+
+    early = {}
+
+    def start_early(early_docs):
+        early["docs"] = early_docs
+        early["task"] = asyncio.create_task(open_stream(query, early_docs, history))
+
+    try:
+        docs = await search_and_recompose_async(
+            query, top_k=top_k, on_candidates=start_early if speculative else None,
+            embeddings_task=embeddings_task
+        )
+    except BaseException:
+        if "task" in early:
+            await discard_stream(early["task"])
+        raise
+
+    if "task" in early and same_top(early["docs"], docs):
+        stream = await early["task"]
+    else:
+        if "task" in early:
+            await discard_stream(early["task"])
+        stream = await open_stream(query, docs, history)
+    if on_docs:
+        on_docs(docs)
+
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # anche in caso di cancellazione: chiude la connessione di streaming
+        await stream.close()
+
+
+async def prompt_with_index_async(query: str, top_k: int = 5, echo: bool = True) -> str:
+    parts = []
+    async for delta in stream_answer(query, top_k=top_k):
+        parts.append(delta)
+        if echo:
+            print(delta, end="", flush=True)
+    if echo:
+        print()
+    return "".join(parts)
+
+
+def prompt_with_index(query: str, top_k: int = 5):
+    return run_sync(prompt_with_index_async(query, top_k=top_k))
+
+
+
+# ======================================================================
+#  💬 CONVERSAZIONE
+#  Il REPL tiene lo stato della sessione: le domande di follow-up ("e
+#  quelli di dicembre?") vengono riscritte in domande autonome e, se
+#  restano sullo stesso argomento, si riusano i documenti del turno
+#  precedente senza rifare il recupero.
+# ======================================================================
+
+REUSE_THRESHOLD = 0.8     # similarità con la domanda precedente oltre cui si riusano i documenti
+HISTORY_TURNS = 3         # turni precedenti passati a riscrittura e prompt
+
+
+class Session:
+    def __init__(self):
+        self.turns = []           # [(domanda autonoma, risposta)]
+        self.docs = []            # documenti dell'ultimo recupero
+        self.embeddings = {}      # embedding della domanda dell'ultimo recupero, per embedder
+        self.query = None         # domanda autonoma dell'ultimo recupero
+        self.date_range = None    # intervallo di date di quella domanda (parse_date_query)
+
+    def history(self) -> list:
+        return self.turns[-HISTORY_TURNS:]
+
+
+def format_history(turns: list, max_chars: int = 600) -> str:
+    return "\n".join(f"Utente: {q}\nAssistente: {a[:max_chars]}" for q, a in turns)
+
+
+async def rewrite_query(query: str, turns: list) -> str:
+    """Riscrive una domanda di follow-up in una domanda autonoma, usando i turni precedenti."""
+    if not turns:
+        return query
+    response = await get_aclient().chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": f"""
+Riscrivi l'ultima domanda dell'utente in modo che sia comprensibile da sola, senza la conversazione:
+esplicita argomenti, date e riferimenti sottintesi. Se è già autonoma restituiscila invariata.
+Rispondi solo con la domanda riscritta.
+
+Conversazione:
+{format_history(turns)}
+
+Ultima domanda: {query}
+"""}],
+        temperature=0
+    )
+    return response.choices[0].message.content.strip() or query
+
+
+def cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
+# Nomi propri, sigle e numeri: "e quelli di Assolombarda?", "e nel 2025?"
+_ENTITY_RE = re.compile(r"\b(?:[A-Z][\w'-]*|\w*\d\w*)")
+
+
+def query_entities(query: str) -> set:
+    """Entità della domanda; la prima parola conta solo se non è maiuscola per inizio frase."""
+    words = query.split(maxsplit=1)
+    rest = words[1] if len(words) > 1 else ""
+    first = {w for w in _ENTITY_RE.findall(words[0]) if any(c.isdigit() for c in w)} if words else set()
+    return first | set(_ENTITY_RE.findall(rest))
+
+
+def on_topic(session: Session, query: str, embeddings: dict) -> bool:
+    """
+    La nuova domanda è vicina a quella dell'ultimo recupero (stesso
+    embedder), con le stesse date e senza entità nuove? "eventi a novembre"
+    e "e quelli di dicembre?" sono vicini per embedding ma vogliono altri
+    documenti.
+    """
+    common = [spec for spec in embeddings if spec in session.embeddings]
+    if not session.docs or not common:
+        return False
+    if parse_date_query(query) != session.date_range:
+        return False
+    if query_entities(query) - query_entities(session.query or ""):
+        return False
+    return cosine(embeddings[common[0]], session.embeddings[common[0]]) >= REUSE_THRESHOLD
+
+
+async def chat_async(session: Session, query: str, top_k: int = 5, echo: bool = True) -> str:
+    """Un turno di conversazione: riscrittura, recupero (o riuso) e risposta in streaming."""
+    standalone = await rewrite_query(query, session.history())
+    if echo and standalone != query:
+        print(f"🔁 {standalone}")
+
+    embeddings_task = asyncio.create_task(embed_query_async(standalone))
+    embeddings = await embeddings_task if session.docs else None
+    docs = None
+    if embeddings and on_topic(session, standalone, embeddings):
+        if echo:
+            print("♻️ Stesso argomento: riuso i documenti del turno precedente")
+        docs = session.docs
+
+    def remember(retrieved):
+        # recupero nuovo (con la risposta anticipata sui candidati locali, vedi stream_answer)
+        session.docs = retrieved
+        session.embeddings = embeddings_task.result()
+        session.query = standalone
+        session.date_range = parse_date_query(standalone)
+
+    parts = []
+    async for delta in stream_answer(standalone, top_k=top_k, docs=docs, history=session.history(),
+                                     embeddings_task=embeddings_task, on_docs=remember):
+        parts.append(delta)
+        if echo:
+            print(delta, end="", flush=True)
+    if echo:
+        print()
+
+    answer = "".join(parts)
+    session.turns.append((standalone, answer))
+    return answer
+
+
+def chat(session: Session, query: str, top_k: int = 5) -> str:
+    return run_sync(chat_async(session, query, top_k=top_k))
 
 
 
@@ -203,14 +957,20 @@ Rispondi in modo chiaro, conciso e indica sempre la SORGENTE delle informazioni.
 
 if __name__ == "__main__":
 
+    # document store e BM25 (in background) pronti prima della prima domanda
+    get_doc_stores()
     print("🔎 Ricerca multi-indice Confindustria")
-    print("Scrivi la tua domanda (exit per uscire)\n")
+    print("Scrivi la tua domanda (exit per uscire, reset per una nuova conversazione)\n")
 
+    session = Session()
     while True:
         query = input("👉 Inserisci il prompt: ")
         if query.lower() in ["exit", "quit", "q"]:
             break
+        if query.lower() == "reset":
+            session = Session()
+            continue
         try:
-            prompt_with_index(query, top_k=3)
+            chat(session, query, top_k=3)
         except Exception as e:
             print("⚠️ Errore:", e)
@@ -5,6 +5,9 @@ from openai import OpenAI
 from pinecone import Pinecone, ServerlessSpec
 from urllib.parse import unquote
 
+from index_alias import resolve
+from embedders import index_dimension, index_embedder
+
 # ======================================================================
 #  INIT OpenAI + Pinecone
 # ======================================================================
@@ -21,16 +24,16 @@ INDEXES = {
 
 # CREA GLI INDICI SE NON ESISTONO
 for idx in INDEXES.values():
-    if idx not in [i["name"] for i in pc.list_indexes()]:
+    if resolve(idx) not in [i["name"] for i in pc.list_indexes()]:
         pc.create_index(
-            name=idx,
-            dimension=1536,
+            name=resolve(idx),
+            dimension=index_dimension(resolve(idx)),
             metric="cosine",
             spec=ServerlessSpec(cloud="aws", region="us-east-1")
         )
 
 # Istanziare gli indici Pinecone
-pinecone_indexes = {label: pc.Index(name) for label, name in INDEXES.items()}
+pinecone_indexes = {label: pc.Index(resolve(name)) for label, name in INDEXES.items()}
 
 
 
@@ -57,11 +60,7 @@ def build_text(item):
     return "\n".join([p for p in parts if p])
 
 def embed_text(text: str):
-    response = client.embeddings.create(
-        model="text-embedding-3-small",
-        input=text
-    )
-    return response.data[0].embedding
+    return index_embedder(resolve(INDEXES["news"])).embed([text])[0]
 
 def chunk_text(text: str, max_chars: int = 2000):
     return [text[i:i+max_chars] for i in range(0, len(text), max_chars)]
@@ -94,10 +93,12 @@ def search_and_recompose(query: str, top_k: int = 5):
                 include_metadata=True
             )
 
-            for m in results["matches"]:
+            # i vettori di documento (kind = "doc") non hanno chunk da ricomporre
+            matches = [m for m in results["matches"] if m["metadata"].get("kind") != "doc"]
+            for m in matches:
                 m["metadata"]["__source_index"] = label
 
-            all_matches.extend(results["matches"])
+            all_matches.extend(matches)
 
         except Exception as e:
             print(f"⚠️ Errore nell'indice {label}: {e}")
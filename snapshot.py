@@ -0,0 +1,339 @@
+import os
+import json
+import struct
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ingest_core import EMBED_MODEL, ensure_index, get_pinecone
+from embedders import index_info, register_index, manifest_embedder
+from doc_store import open_store
+
+# ======================================================================
+#  SNAPSHOT DEGLI INDICI
+#  Una cartella per indice:
+#    vectors.npy      matrice float32 (n × dim), apribile in memory-map
+#    records.parquet  colonne id / text / metadata (JSON), stesso ordine
+#    manifest.json    indice, dimensione, numero di vettori; scritto per
+#                     ultimo, quindi la sua presenza garantisce uno
+#                     snapshot completo
+#  Scrittura e lettura procedono a batch: la memoria resta limitata.
+#
+#  Esempi:
+#    python snapshot.py dump confindustria-news snapshots/news
+#    python snapshot.py load snapshots/news --index confindustria-news
+# ======================================================================
+
+VECTORS_FILE = "vectors.npy"
+RECORDS_FILE = "records.parquet"
+MANIFEST_FILE = "manifest.json"
+
+_NPY_HEADER_LEN = 128     # header .npy a lunghezza fissa: riscrivibile a fine export
+
+_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("text", pa.string()),
+    ("metadata", pa.string()),
+])
+
+
+def _npy_header(count: int, dim: int) -> bytes:
+    header = "{'descr': '<f4', 'fortran_order': False, 'shape': (%d, %d), }" % (count, dim)
+    header = header.ljust(_NPY_HEADER_LEN - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class SnapshotWriter:
+    """Scrive uno snapshot in streaming, un batch di vettori alla volta."""
+
+    def __init__(self, path: str, index_name: str, dimension: int, embed_model: str = EMBED_MODEL):
+        self.path = path
+        self.index_name = index_name
+        self.dimension = dimension
+        self.embed_model = embed_model
+        self.count = 0
+        os.makedirs(path, exist_ok=True)
+        manifest = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest):
+            os.remove(manifest)
+
+        self._vectors = open(os.path.join(path, VECTORS_FILE), "wb")
+        self._vectors.write(_npy_header(0, dimension))
+        self._records = pq.ParquetWriter(os.path.join(path, RECORDS_FILE), _SCHEMA)
+
+    def write(self, vectors: list[dict]):
+        """Aggiunge vettori nel formato dell'upsert Pinecone: {"id", "values", "metadata"}."""
+        if not vectors:
+            return
+        matrix = np.asarray([v["values"] for v in vectors], dtype="<f4")
+        if matrix.shape[1] != self.dimension:
+            raise ValueError(f"Dimensione {matrix.shape[1]} diversa da {self.dimension}")
+        self._vectors.write(matrix.tobytes())
+
+        ids, texts, metadatas = [], [], []
+        for v in vectors:
+            metadata = dict(v.get("metadata") or {})
+            ids.append(v["id"])
+            texts.append(metadata.pop("text", None))
+            metadatas.append(json.dumps(metadata, ensure_ascii=False))
+        self._records.write_table(pa.table([ids, texts, metadatas], schema=_SCHEMA))
+        self.count += len(vectors)
+
+    def close(self):
+        self._records.close()
+        self._vectors.seek(0)
+        self._vectors.write(_npy_header(self.count, self.dimension))
+        self._vectors.close()
+
+        manifest = {
+            "index": self.index_name,
+            "dimension": self.dimension,
+            "count": self.count,
+            "embed_model": self.embed_model,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._records.close()
+            self._vectors.close()
+
+
+def read_manifest(path: str) -> dict:
+    manifest = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest):
+        raise FileNotFoundError(f"Snapshot incompleto o inesistente: {path}")
+    with open(manifest, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_snapshot(path: str, batch_size: int = 500):
+    """Legge lo snapshot a batch di vettori {"id", "values", "metadata"}."""
+    read_manifest(path)
+    matrix = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+    records = pq.ParquetFile(os.path.join(path, RECORDS_FILE))
+
+    offset = 0
+    for batch in records.iter_batches(batch_size=batch_size):
+        rows = batch.to_pydict()
+        values = np.asarray(matrix[offset:offset + batch.num_rows], dtype=np.float32)
+        vectors = []
+        for i, vector_id in enumerate(rows["id"]):
+            metadata = json.loads(rows["metadata"][i])
+            if rows["text"][i] is not None:
+                metadata["text"] = rows["text"][i]
+            vectors.append({"id": vector_id, "values": values[i].tolist(), "metadata": metadata})
+        offset += batch.num_rows
+        yield vectors
+
+
+# ======================================================================
+#  EXPORT / IMPORT PINECONE
+# ======================================================================
+
+def dump_index(index_name: str, path: str, batch_size: int = 100) -> int:
+    """
+    Esporta un indice Pinecone esistente (vettori + metadata), senza
+    ricalcolare embedding. Per un indice con metadata compatti il testo
+    dei chunk viene dal suo document store.
+    """
+    pc = get_pinecone()
+    description = pc.describe_index(index_name)
+    index = pc.Index(index_name)
+    store = open_store(index_name)
+
+    with SnapshotWriter(path, index_name, description.dimension,
+                        embed_model=index_info(index_name)["embedder"]) as writer:
+        for ids in index.list(limit=batch_size):
+            fetched = index.fetch(ids=ids).vectors
+            vectors = [{"id": v.id, "values": v.values, "metadata": dict(v.metadata or {})}
+                       for v in (fetched[i] for i in ids if i in fetched)]
+            if store:
+                store.hydrate([v["metadata"] for v in vectors if v["metadata"].get("kind") != "doc"])
+            writer.write(vectors)
+            print(f"Esportati {writer.count} vettori")
+    if store:
+        store.close()
+    return writer.count
+
+
+def load_snapshot(path: str, index_name: str = None, batch_size: int = 200, threads: int = 4) -> int:
+    """Carica uno snapshot su Pinecone con upsert paralleli, senza passare dalle API di embedding."""
+    manifest = read_manifest(path)
+    index_name = index_name or manifest["index"]
+    index = ensure_index(index_name, dimension=manifest["dimension"], spec=manifest_embedder(manifest))
+    register_index(index_name, manifest_embedder(manifest), manifest["dimension"])
+
+    loaded = 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = []
+        for vectors in iter_snapshot(path, batch_size=batch_size):
+            pending.append(pool.submit(index.upsert, vectors))
+            loaded += len(vectors)
+            # al massimo 2 batch in coda per thread: memoria limitata
+            if len(pending) >= threads * 2:
+                pending.pop(0).result()
+        for future in pending:
+            future.result()
+    print(f"✔️ Caricati {loaded} vettori su {index_name}")
+    return loaded
+
+
+# ======================================================================
+#  INDICE LOCALE
+# ======================================================================
+
+def _match_filter(metadata: dict, flt: dict) -> bool:
+    """Sottoinsieme dei filtri Pinecone: $eq $ne $in $nin $gt $gte $lt $lte $and $or."""
+    for key, cond in flt.items():
+        if key == "$and":
+            if not all(_match_filter(metadata, c) for c in cond):
+                return False
+            continue
+        if key == "$or":
+            if not any(_match_filter(metadata, c) for c in cond):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            if op == "$eq" and value != arg:
+                return False
+            if op == "$ne" and value == arg:
+                return False
+            if op == "$in" and value not in arg:
+                return False
+            if op == "$nin" and value in arg:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > arg:
+                    return False
+                if op == "$gte" and not value >= arg:
+                    return False
+                if op == "$lt" and not value < arg:
+                    return False
+                if op == "$lte" and not value <= arg:
+                    return False
+    return True
+
+
+class LocalIndex:
+    """
+    Indice in locale su uno snapshot: stessa interfaccia di query/fetch
+    dell'indice Pinecone, ricerca esatta per similarità coseno sulla
+    matrice in memory-map.
+    """
+
+    def __init__(self, path: str, block_size: int = 50_000):
+        self.manifest = read_manifest(path)
+        self.block_size = block_size
+        self._matrix = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+
+        self.ids = []
+        self.metadata = []
+        for batch in pq.ParquetFile(os.path.join(path, RECORDS_FILE)).iter_batches():
+            rows = batch.to_pydict()
+            for i, vector_id in enumerate(rows["id"]):
+                metadata = json.loads(rows["metadata"][i])
+                if rows["text"][i] is not None:
+                    metadata["text"] = rows["text"][i]
+                self.ids.append(vector_id)
+                self.metadata.append(metadata)
+        self._positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+
+        norms = [np.linalg.norm(self._matrix[i:i + block_size], axis=1)
+                 for i in range(0, len(self.ids), block_size)]
+        self._norms = np.concatenate(norms) if norms else np.zeros(0, dtype=np.float32)
+        self._norms[self._norms == 0] = 1.0
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True,
+              filter: dict = None, include_values: bool = False) -> dict:
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+
+        allowed = None
+        if filter:
+            allowed = np.array([_match_filter(m, filter) for m in self.metadata], dtype=bool)
+
+        scores = np.empty(len(self.ids), dtype=np.float32)
+        for i in range(0, len(self.ids), self.block_size):
+            block = self._matrix[i:i + self.block_size]
+            scores[i:i + len(block)] = block @ q / self._norms[i:i + len(block)]
+        if allowed is not None:
+            scores[~allowed] = -np.inf
+
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k] if k else []
+        best = sorted(best, key=lambda i: -scores[i])
+
+        matches = []
+        for i in best:
+            if scores[i] == -np.inf:
+                continue
+            match = {"id": self.ids[i], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = dict(self.metadata[i])
+            if include_values:
+                match["values"] = self._matrix[i].tolist()
+            matches.append(match)
+        return {"matches": matches}
+
+    def fetch(self, ids: list[str]) -> dict:
+        vectors = {}
+        for vector_id in ids:
+            i = self._positions.get(vector_id)
+            if i is not None:
+                vectors[vector_id] = {
+                    "id": vector_id,
+                    "values": self._matrix[i].tolist(),
+                    "metadata": dict(self.metadata[i]),
+                }
+        return {"vectors": vectors}
+
+
+# ======================================================================
+#  MAIN
+# ======================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Snapshot degli indici Confindustria Varese")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dump = sub.add_parser("dump", help="esporta un indice Pinecone in uno snapshot")
+    dump.add_argument("index")
+    dump.add_argument("path")
+
+    load = sub.add_parser("load", help="carica uno snapshot su Pinecone")
+    load.add_argument("path")
+    load.add_argument("--index", help="indice di destinazione (default: quello del manifest)")
+    load.add_argument("--batch-size", type=int, default=200)
+    load.add_argument("--threads", type=int, default=4)
+
+    info = sub.add_parser("info", help="mostra il manifest di uno snapshot")
+    info.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "dump":
+        dump_index(args.index, args.path)
+    elif args.command == "load":
+        load_snapshot(args.path, args.index, batch_size=args.batch_size, threads=args.threads)
+    else:
+        print(json.dumps(read_manifest(args.path), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from ingest_core import chunk_text
+
+# ======================================================================
+#  ADATTATORI DELLE SORGENTI
+#  Ogni sorgente sa come trasformare un elemento del proprio export JSON,
+#  già ripulito da preprocess.py, nei record da indicizzare:
+#  {"id", "text", "metadata"}.
+# ======================================================================
+
+
+def field(item, key: str) -> str:
+    value = item.get(key)
+    return value if isinstance(value, str) else ""
+
+
+def parse_date(date_str: str) -> int:
+    dt = datetime.strptime(date_str, "%Y-%m-%d")
+    return int(dt.strftime("%Y%m%d"))
+
+
+def parse_date_str(date_str: str) -> str:
+    dt = datetime.strptime(date_str, "%Y-%m-%d")
+    return dt.strftime("%Y-%m-%d")
+
+
+class Source(ABC):
+    name = ""
+    index_name = ""
+    default_path = ""
+    body_fields = ()          # campi lunghi in cui cercare righe boilerplate
+    doc_fields = ()           # campi del vettore di documento (titolo, sintesi, tag)
+
+    @abstractmethod
+    def build_text(self, item) -> str:
+        ...
+
+    @abstractmethod
+    def records(self, item) -> list[dict]:
+        ...
+
+    def doc_record(self, item, records: list[dict]):
+        """
+        Vettore a livello di documento (id = unid_doc, metadata kind = "doc"),
+        costruito dai campi brevi: per le domande corte (nomi di eventi,
+        titoli) è un bersaglio migliore dei chunk da 2000 caratteri.
+        """
+        text = "\n".join([field(item, f) for f in self.doc_fields if field(item, f)])
+        if not text or not records:
+            return None
+        metadata = {k: v for k, v in records[0]["metadata"].items()
+                    if k not in ("text", "chunk_index", "aliases")}
+        metadata.update({"kind": "doc", "text": text, "chunk_total": len(records)})
+        return {"id": f"{item['unid']}_doc", "text": text, "metadata": metadata}
+
+    def all_records(self, item, doc_vectors: bool = True) -> list[dict]:
+        records = self.records(item)
+        doc = self.doc_record(item, records) if doc_vectors else None
+        return records + [doc] if doc else records
+
+
+class EventiSource(Source):
+    """Eventi: un solo vettore per evento, id = unid."""
+
+    name = "events"
+    index_name = "confindustria-eventi"
+    default_path = "eventiConfindustria.json"
+    body_fields = ("descrizione",)
+    doc_fields = ("titolo", "AreaInteresse", "Settori", "Tags")
+
+    def build_text(self, item):
+        fields = ["titolo", "data", "descrizione", "AreaInteresse", "Settori", "Tags"]
+        return "\n".join([field(item, f) for f in fields if field(item, f)])
+
+    def records(self, item):
+        text = self.build_text(item)
+        return [{
+            "id": item["unid"],
+            "text": text,
+            "metadata": {
+                "unid": item.get("unid"),
+                "titolo": field(item, "titolo"),
+                "data": parse_date_str(item.get("data")),
+                "text": text,
+                "settori": field(item, "Settori"),
+                "areainteresse": field(item, "AreaInteresse"),
+                "tags": field(item, "Tags"),
+                # 🔥 INDICATORE DELLA FONTE
+                "source": "confindustria_varese_eventi"
+            }
+        }]
+
+
+class PostsSource(Source):
+    """Post: testo spezzato in chunk da 2000 caratteri."""
+
+    name = "posts"
+    index_name = "confindustria-posts"
+    default_path = "postsConfindustria.json"
+    body_fields = ("content",)
+    doc_fields = ("title", "category", "categoryfull")
+    max_chars = 2000
+
+    def build_text(self, item):
+        fields = ["title", "date", "url", "category", "categoryfull", "content"]
+        return "\n".join([field(item, f) for f in fields if field(item, f)])
+
+    def records(self, item):
+        doc_id = item["unid"]
+        chunks = chunk_text(self.build_text(item), max_chars=self.max_chars)
+        return [{
+            "id": f"{doc_id}_chunk{idx}",
+            "text": chunk,
+            "metadata": {
+                "unid": item.get("unid"),
+                "title": field(item, "title"),
+                "date": item.get("date"),
+                "text": chunk,  # solo il pezzo corrente
+                "category": field(item, "category"),
+                "categoryfull": field(item, "categoryfull"),
+                "url": field(item, "url"),
+                "source": "confindustria_varese_post",
+                "chunk_index": idx,
+                "chunk_total": len(chunks)
+            }
+        } for idx, chunk in enumerate(chunks)]
+
+
+class NotiziarioSource(Source):
+    """Notiziario: testo spezzato in chunk da 2000 caratteri."""
+
+    name = "news"
+    index_name = "confindustria-news"
+    default_path = "notiziarioConfindustria.json"
+    body_fields = ("content", "circolareinbreve")
+    doc_fields = ("title", "subject", "circolareinbreve", "areatematica", "interesse")
+    max_chars = 2000
+
+    def build_text(self, item):
+        """Costruisce il testo da indicizzare concatenando i campi utili."""
+        fields = ["title", "subject", "content", "circolareinbreve",
+                  "settore", "areatematica", "interesse"]
+        return "\n".join([field(item, f) for f in fields if field(item, f)])
+
+    def records(self, item):
+        doc_id = item["unid"]
+        chunks = chunk_text(self.build_text(item), max_chars=self.max_chars)
+        return [{
+            "id": f"{doc_id}_chunk{idx}",
+            "text": chunk,
+            "metadata": {
+                "unid": item.get("unid"),
+                "title": field(item, "title"),
+                "date": item.get("date"),
+                "settore": field(item, "settore"),
+                "areatematica": field(item, "areatematica"),
+                "interesse": field(item, "interesse"),
+                "text": chunk,               # SOLO il chunk → metadata leggera!
+                "source": "notiziario",
+                "chunk_index": idx,
+                "chunk_total": len(chunks)
+            }
+        } for idx, chunk in enumerate(chunks)]
+
+
+SOURCES = {s.name: s for s in (EventiSource(), PostsSource(), NotiziarioSource())}
@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import RateLimitError, APIConnectionError
+
+from ingest_core import get_openai
+
+# ======================================================================
+#  SINTESI DEI DOCUMENTI
+#  Fase opzionale dell'ingestione: una sintesi breve per unid, salvata su
+#  SQLite con l'hash del testo. Viene rigenerata solo quando il testo
+#  cambia, quindi il costo si paga una volta all'ingestione. Nel prompt
+#  promptConfVa usa le sintesi per tutti i documenti tranne il primo, che
+#  resta a testo pieno, e solo se l'hash corrisponde ancora al testo.
+#    summaries(unid, source, hash, summary)
+# ======================================================================
+
+SUMMARIES_PATH = os.environ.get("CONFVA_SUMMARIES", "summaries.sqlite")
+SUMMARY_MODEL = "gpt-4.1-mini"
+MIN_CHARS = 1500          # i documenti più corti vanno nel prompt interi: la sintesi non serve
+
+SUMMARY_PROMPT = """
+Riassumi il seguente documento di Confindustria Varese in italiano, in non più di 5 frasi.
+Conserva date, scadenze, importi, destinatari e riferimenti normativi; niente introduzioni.
+
+{text}
+"""
+
+
+class SummaryStore:
+    def __init__(self, path: str = SUMMARIES_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                unid TEXT PRIMARY KEY,
+                source TEXT,
+                hash TEXT NOT NULL,
+                summary TEXT NOT NULL
+            )
+        """)
+
+    def hashes(self) -> dict:
+        with self._lock:
+            return dict(self._conn.execute("SELECT unid, hash FROM summaries").fetchall())
+
+    def put(self, rows: list[tuple]):
+        """rows: [(unid, source, hash, summary)]"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO summaries (unid, source, hash, summary) VALUES (?, ?, ?, ?)",
+                rows
+            )
+
+    def get(self, unids) -> dict:
+        """{unid: (hash, sintesi)}: l'hash è quello del testo da cui la sintesi è stata generata."""
+        unids = list(set(unids))
+        if not unids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT unid, hash, summary FROM summaries WHERE unid IN ({','.join('?' * len(unids))})",
+                unids
+            ).fetchall()
+        return {unid: (digest, summary) for unid, digest, summary in rows}
+
+    def delete(self, unids):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM summaries WHERE unid = ?", [(unid,) for unid in unids])
+
+    def close(self):
+        self._conn.close()
+
+
+def open_summaries(path: str = SUMMARIES_PATH):
+    """Store esistente, oppure None se le sintesi non sono mai state generate."""
+    return SummaryStore(path) if os.path.exists(path) else None
+
+
+def documents_from_records(records: list[dict]) -> dict:
+    """Testo completo per unid, dai chunk in ordine: {unid: (source, testo)}."""
+    chunks = {}
+    for record in records:
+        metadata = record["metadata"]
+        if metadata.get("kind") == "doc":
+            continue
+        text = metadata.get("text", record["text"])
+        chunks.setdefault(metadata["unid"], (metadata.get("source"), []))[1].append(
+            (int(metadata.get("chunk_index") or 0), text)
+        )
+    return {unid: (source, "\n".join(t for _, t in sorted(parts)))
+            for unid, (source, parts) in chunks.items()}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def summarize(text: str, retries: int = 5) -> str:
+    client = get_openai()
+    for attempt in range(retries):
+        try:
+            response = client.chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=[{"role": "user", "content": SUMMARY_PROMPT.format(text=text)}],
+                temperature=0
+            )
+            return response.choices[0].message.content.strip()
+        except (RateLimitError, APIConnectionError) as e:
+            if attempt == retries - 1:
+                raise
+            delay = 2 ** attempt
+            print(f"⚠️ Sintesi ritentata tra {delay}s: {e}")
+            time.sleep(delay)
+
+
+def summarize_records(records: list[dict], store: SummaryStore, batch_size: int = 16,
+                      threads: int = 4, min_chars: int = MIN_CHARS, dry_run: bool = False) -> dict:
+    """
+    Genera le sintesi mancanti o non più aggiornate (hash del testo
+    cambiato) ed elimina quelle dei documenti diventati troppo corti. Le
+    richieste di un batch partono in parallelo; ogni batch viene salvato
+    appena completo, così un'interruzione non perde il lavoro.
+    """
+    documents = documents_from_records(records)
+    known = store.hashes()
+    todo, short, cached = [], [], 0
+    for unid, (source, text) in documents.items():
+        if len(text) < min_chars:
+            if unid in known:
+                short.append(unid)
+            continue
+        digest = text_hash(text)
+        if known.get(unid) == digest:
+            cached += 1
+        else:
+            todo.append((unid, source, digest, text))
+
+    stats = {"documents": len(documents), "generated": 0 if dry_run else len(todo), "cached": cached,
+             "deleted": 0 if dry_run else len(short)}
+    if not dry_run:
+        store.delete(short)
+    if dry_run or not todo:
+        print(f"📝 Sintesi: {len(todo)} da generare su {len(documents)} documenti")
+        return stats
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for i in range(0, len(todo), batch_size):
+            batch = todo[i:i+batch_size]
+            summaries = pool.map(summarize, [text for *_, text in batch])
+            store.put([(unid, source, digest, summary)
+                       for (unid, source, digest, _), summary in zip(batch, summaries)])
+            print(f"📝 Sintesi {min(i + batch_size, len(todo))}/{len(todo)}")
+    return stats